@@ -0,0 +1,77 @@
+# Per chunk cost of the gain stage, pydub implementation against numpy one.
+# Run from src directory: python -m benchmarks.gain
+import timeit
+
+import numpy as np
+from pydub import AudioSegment
+
+from cue.volume import Volume
+from engine.dsp import GainStage, defaultRouting
+from engine.player import MixerProcess
+
+REPEAT = 5
+NUMBER = 200
+
+
+def pydubApplyVolume(audio: AudioSegment, volume: Volume) -> AudioSegment:
+    # Gain stage used before the numpy implementation
+    segment = AudioSegment.empty() + audio
+    if volume.left or volume.right:
+        left, right = audio.split_to_mono()
+        if volume.left == Volume.MIN:
+            left = left - 120.0
+        else:
+            left = left + volume.left
+        if volume.right == Volume.MIN:
+            right = right - 120
+        else:
+            right = right + volume.right
+        segment = AudioSegment.from_mono_audiosegments(left, right)
+    if volume.master:
+        if volume.master == Volume.MIN:
+            segment = segment - 120
+        else:
+            segment = segment + volume.master
+    return segment
+
+
+def chunk(channels: int = MixerProcess.CHANNELS) -> np.ndarray:
+    frames = MixerProcess().chunkFrames()
+    rng = np.random.default_rng(0)
+    return rng.integers(-20000, 20000, size=(frames, channels), dtype=np.int16)
+
+
+def measure(statement) -> float:
+    # Best per call time, in microseconds
+    return min(timeit.repeat(statement, repeat=REPEAT, number=NUMBER)) / NUMBER * 1e6
+
+
+def main():
+    samples = chunk()
+    volume = Volume(-3.0, 2.0, -1.5)
+    audio = AudioSegment(
+        samples.tobytes(),
+        frame_rate=MixerProcess.FRAME_RATE,
+        sample_width=samples.dtype.itemsize,
+        channels=MixerProcess.CHANNELS
+    )
+    stage = GainStage(defaultRouting(MixerProcess.CHANNELS, MixerProcess.CHANNELS), volume, len(samples))
+    mix = np.zeros(samples.shape, dtype=np.float32)
+
+    before = measure(lambda: pydubApplyVolume(audio, volume))
+    after = measure(lambda: stage.mixInto(mix, samples))
+    print(f'Chunk of {MixerProcess.CHUNK_SIZE_DEFAULT:.0f}ms ({len(samples)} frames, {MixerProcess.CHANNELS} channels)')
+    print(f'pydub gain stage: {before:10.1f}us per chunk')
+    print(f'numpy gain stage: {after:10.1f}us per chunk')
+    print(f'speed up: {before / after:.1f}x')
+    # Source channels to output channels
+    for sourceChannels, outputChannels in ((2, 2), (1, 2), (6, 2), (8, 8)):
+        samples = chunk(sourceChannels)
+        stage = GainStage(defaultRouting(sourceChannels, outputChannels), volume, len(samples))
+        mix = np.zeros((len(samples), outputChannels), dtype=np.float32)
+        routed = measure(lambda: stage.mixInto(mix, samples))
+        print(f'routing {sourceChannels} to {outputChannels} channels: {routed:6.1f}us per chunk')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Volume messages per second from the GUI to the mixer process,
+# multiprocessing.Queue of dicts against the binary pipe protocol.
+# Run from src directory: python -m benchmarks.ipc
+import time
+from multiprocessing import Process, Queue
+
+from cue.volume import Volume
+from engine.ipc import MessagePipe
+from engine.player import PlayerCommand
+
+MESSAGES = 50000
+
+
+def queueReceiver(queue: Queue, done: Queue) -> None:
+    for _ in range(MESSAGES):
+        PlayerCommand.fromMessage(queue.get())
+    done.put(time.monotonic())
+
+
+def pipeReceiver(pipe: MessagePipe, done: Queue) -> None:
+    for _ in range(MESSAGES):
+        PlayerCommand.fromBytes(pipe.receive())
+    done.put(time.monotonic())
+
+
+def measure(receiver, channel, send) -> float:
+    # Messages per second, from the first sent to the last decoded
+    done = Queue()
+    process = Process(target=receiver, args=(channel, done))
+    process.start()
+    start = time.monotonic()
+    for index in range(MESSAGES):
+        send(PlayerCommand('volume', Volume(-float(index % 30), 0.0, 0.0), index % 100))
+    end = done.get()
+    process.join()
+    return MESSAGES / (end - start)
+
+
+def main():
+    queue = Queue()
+    pipe = MessagePipe()
+    before = measure(queueReceiver, queue, lambda cmd: queue.put(cmd.toMessage()))
+    after = measure(pipeReceiver, pipe, lambda cmd: pipe.send(cmd.toBytes()))
+    print(f'{MESSAGES} volume messages')
+    print(f'Queue of dicts: {before:10.0f} messages/s')
+    print(f'binary pipe:    {after:10.0f} messages/s')
+    print(f'speed up: {after / before:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
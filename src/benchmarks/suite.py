@@ -0,0 +1,294 @@
+# Timings of the audio and waveform hot paths on synthetic media files,
+# saved as JSON to compare them between commits.
+# Run from src directory:
+#   python -m benchmarks.suite --output before.json
+#   python -m benchmarks.suite --output after.json --compare before.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import wave
+from multiprocessing import Process
+from typing import Callable, Optional
+
+import numpy as np
+from pydub import AudioSegment
+
+from cue.audioloader import loadAudio
+from cue.fade import Fade
+from cue.peaks import PeakPyramid
+from cue.volume import Volume
+from engine.ipc import MessagePipe
+from engine.pcmbuffer import PcmBuffer
+from engine.pcmcache import PcmCache
+from engine.player import MixerProcess, PlayerCommand, PlayerStates, Voice
+
+# Media durations in seconds, and the shorter ones of a quick run
+DURATIONS = (10, 60, 300)
+QUICK_DURATIONS = (10, 60)
+# Channel counts of the files of this duration
+CHANNELS_DURATION = 60
+CHANNELS = (1, 2, 6)
+RUNS = 5
+CHUNKS = 200
+ROUND_TRIPS = 2000
+# Median slower than the compared one by more than this is reported
+REGRESSION = 1.2
+
+
+def writeWav(path: str, duration: float, channels: int, frameRate: int = MixerProcess.FRAME_RATE) -> str:
+    # Tone with some noise, different on each channel
+    rng = np.random.default_rng(0)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(frameRate)
+        for start in range(0, round(duration * frameRate), frameRate):
+            times = np.arange(start, start + frameRate)[:, np.newaxis] / frameRate
+            tone = np.sin(2 * np.pi * 440.0 * (np.arange(channels) + 1) * times)
+            samples = 10000 * tone + rng.normal(0, 1000, tone.shape)
+            wav.writeframes(samples.astype('<i2').tobytes())
+    return path
+
+
+def writeMp3(path: str, wavPath: str) -> Optional[str]:
+    # Needs ffmpeg, like compressed files in the application
+    if shutil.which(AudioSegment.converter) is None:
+        return None
+    AudioSegment.from_wav(wavPath).export(path, format='mp3')
+    return path
+
+
+def measure(function: Callable[[], None], runs: int, setup: Optional[Callable[[], None]] = None) -> dict:
+    durations = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return summary(durations)
+
+
+def summary(durations: list[float], count: int = 1) -> dict:
+    # Milliseconds, per call when each duration covers count calls
+    milliseconds = [duration * 1000.0 / count for duration in durations]
+    return {'median': statistics.median(milliseconds), 'min': min(milliseconds), 'runs': len(milliseconds)}
+
+
+def benchLoad(fixtures: dict[str, str], runs: int) -> dict:
+    # Decoding and waveform peaks, as done when a cue is loaded
+    results = {}
+    cache = PcmCache.instance()
+    for name, path in fixtures.items():
+        def load():
+            audio = loadAudio(path)
+            if audio.buffer is not None:
+                audio.buffer.release()
+        if name.startswith('wav-'):
+            results[f'load/{name}'] = measure(load, runs)
+        else:
+            # Compressed or converted files: first load decodes, next ones map the cache
+            results[f'load/{name}/cold'] = measure(load, runs, setup=cache.purge)
+            results[f'load/{name}/cached'] = measure(load, runs)
+    return results
+
+
+def benchPeaks(durations: tuple[int, ...], runs: int) -> dict:
+    results = {}
+    for duration in durations:
+        frames = duration * MixerProcess.FRAME_RATE
+        samples = np.random.default_rng(0).integers(-20000, 20000, size=(frames, 2), dtype=np.int16)
+
+        def build():
+            peaks = PeakPyramid(frames, MixerProcess.FRAME_RATE)
+            for position in range(0, frames, 16384):
+                peaks.add(position, samples[position:position + 16384])
+            peaks.build()
+        results[f'peaks/{duration}s'] = measure(build, runs)
+    return results
+
+
+def renderChunks(voice: Voice, chunks: int) -> None:
+    mix = np.zeros((MixerProcess().chunkFrames(), MixerProcess.CHANNELS), dtype=np.float32)
+    for _ in range(chunks):
+        if not voice.isPlaying():
+            voice.execute(PlayerCommand('play'))
+        mix[:] = 0
+        voice.render(mix)
+
+
+def benchRender(runs: int) -> dict:
+    # Mixer work for one chunk of a playing cue: read, gains, fade
+    results = {}
+    pipe = MessagePipe(blockingWrite=False)
+    chunkSize = MixerProcess.CHUNK_SIZE_DEFAULT
+    frames = 300 * MixerProcess.FRAME_RATE
+    for channels in CHANNELS:
+        buffer = PcmBuffer.create(frames, channels, np.int16)
+        buffer.samples[:] = np.random.default_rng(0).integers(-20000, 20000, size=buffer.samples.shape, dtype=np.int16)
+        voice = Voice(0, {'buffer': buffer.path}, pipe, chunkSize)
+        voice.execute(PlayerCommand('volume', Volume(-3.0, 1.0, -1.0)))
+        results[f'render/{channels}ch'] = summary(
+            [measureOnce(lambda: renderChunks(voice, CHUNKS)) for _ in range(runs)], CHUNKS
+        )
+        if channels == 2:
+            # Every chunk of a 300s file inside its fade out
+            voice.execute(PlayerCommand('fade', Fade(0.0, 300.0)))
+            results['render/2ch/fade'] = summary(
+                [measureOnce(lambda: renderChunks(voice, CHUNKS)) for _ in range(runs)], CHUNKS
+            )
+        voice.release()
+        buffer.release()
+    return results
+
+
+def measureOnce(function: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def echo(pipeIn: MessagePipe, pipeOut: MessagePipe) -> None:
+    # Mixer side of the round trip: decode each command, answer its state
+    pipeIn.closeWriter()
+    pipeOut.closeReader()
+    while True:
+        cmd = PlayerCommand.fromBytes(pipeIn.receive())
+        if cmd.command == 'quit':
+            break
+        pipeOut.send(PlayerCommand('state', PlayerStates.Playing, cmd.cueId).toBytes())
+
+
+def benchIpc(runs: int) -> dict:
+    pipeIn = MessagePipe()
+    pipeOut = MessagePipe()
+    process = Process(target=echo, args=(pipeIn, pipeOut))
+    process.start()
+    pipeIn.closeReader()
+    pipeOut.closeWriter()
+    durations = []
+    try:
+        for index in range(ROUND_TRIPS * runs):
+            start = time.perf_counter()
+            pipeIn.send(PlayerCommand('volume', Volume(-float(index % 30), 0.0, 0.0), index % 100).toBytes())
+            PlayerCommand.fromBytes(pipeOut.receive(1.0))
+            durations.append(time.perf_counter() - start)
+    finally:
+        pipeIn.send(PlayerCommand('quit').toBytes())
+        process.join()
+    return {'ipc/roundTrip': summary(durations)}
+
+
+def benchWaveform(fixtures: dict[str, str], runs: int) -> dict:
+    # Drawing of the waveform of a loaded cue
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    from ui.soundwiget import Soundwidget
+    app = QApplication.instance() or QApplication([])
+    widget = Soundwidget()
+    widget.resize(1200, 200)
+    widget.show()
+    results = {}
+    for name, path in fixtures.items():
+        if not name.startswith('wav-') or not name.endswith('-2ch'):
+            continue
+        audio = loadAudio(path)
+        if audio.buffer is not None:
+            audio.buffer.release()
+
+        def draw():
+            widget.setSeries(audio.peaks.level(widget.waveformWidth()), 0.0, audio.duration)
+            app.processEvents()
+        results[f'waveform/{name}'] = measure(draw, runs)
+    widget.close()
+    return results
+
+
+def fixtures(directory: str, durations: tuple[int, ...]) -> dict[str, str]:
+    files = {}
+    for duration in durations:
+        channels = CHANNELS if duration == CHANNELS_DURATION else (2,)
+        for count in channels:
+            name = f'wav-{duration}s-{count}ch'
+            files[name] = writeWav(os.path.join(directory, f'{name}.wav'), duration, count)
+    name = f'wav48k-{CHANNELS_DURATION}s-2ch'
+    files[name] = writeWav(os.path.join(directory, f'{name}.wav'), CHANNELS_DURATION, 2, 48000)
+    mp3 = writeMp3(os.path.join(directory, 'mp3-60s-2ch.mp3'), files[f'wav-{CHANNELS_DURATION}s-2ch'])
+    if mp3 is not None:
+        files['mp3-60s-2ch'] = mp3
+    else:
+        print('ffmpeg not found, no MP3 fixture')
+    return files
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous: dict) -> None:
+    print(f'\nCompared to {previous.get("commit")} ({previous.get("date")})')
+    for name, result in results.items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['median'] / before['median'] if before['median'] else 1.0
+        flag = '  slower' if ratio > REGRESSION else ''
+        print(f'{name:32} {before["median"]:10.3f} -> {result["median"]:10.3f} ms  {ratio:5.2f}x{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the audio and waveform hot paths')
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='JSON file of previous results')
+    parser.add_argument('--quick', action='store_true', help=f'Only files up to {QUICK_DURATIONS[-1]}s')
+    parser.add_argument('--runs', type=int, default=RUNS)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='qsound-bench-')
+    # Cache of the benchmark only, user cache is left untouched
+    PcmCache._instance = PcmCache(os.path.join(directory, 'cache'), 1 << 32)
+    try:
+        files = fixtures(directory, QUICK_DURATIONS if args.quick else DURATIONS)
+        results = {}
+        for bench in (
+            lambda: benchLoad(files, args.runs),
+            lambda: benchPeaks(QUICK_DURATIONS if args.quick else DURATIONS, args.runs),
+            lambda: benchRender(args.runs),
+            lambda: benchIpc(args.runs),
+            lambda: benchWaveform(files, args.runs),
+        ):
+            for name, result in bench().items():
+                results[name] = result
+                print(f'{name:32} median {result["median"]:10.3f} ms  min {result["min"]:10.3f} ms')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'commit': commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
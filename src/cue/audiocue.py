@@ -1,14 +1,14 @@
-import array
 import logging
 import math
+from typing import Optional
 
-import numpy as np
-from pydub import AudioSegment
 from PySide6.QtCore import QFileInfo, Signal, Slot
 from PySide6 import QtWidgets
 
+from cue.audioloader import AudioData, AudioLoader
 from cue.basecue import BaseCue
 from cue.fade import Fade
+from cue.peaks import PeakLevel, PeakPyramid
 from cue.volume import Volume
 from engine.player import Player, PlayerStates
 
@@ -37,17 +37,25 @@ class CueInfo:
 class AudioCue (BaseCue):
 
     changedCue = Signal(CueInfo, name='changedCue')
-    audioSignalChanged = Signal(list, float, float, name='audioSignalChanged')
+    audioSignalChanged = Signal(PeakLevel, float, float, name='audioSignalChanged')
+    # Percent of the media file loaded
+    loadingChanged = Signal(int, name='loadingChanged')
+    # Media file loaded, the cue can be played
+    loaded = Signal(name='loaded')
 
-    def __init__(self, filename: str) -> None:
+    def __init__(self, filename: str, load: bool = True) -> None:
         super().__init__()
         app = QtWidgets.QApplication.instance()
         app.aboutToQuit.connect(self.quit)
         self.player = None
-        self.setSource(filename)
+        self._loader: Optional[AudioLoader] = None
+        self.setSource(filename, load)
 
     @Slot()
     def quit(self):
+        if self._loader:
+            self._loader.cancel()
+            self._loader = None
         if self.player:
             self.player.quit()
 
@@ -56,44 +64,110 @@ class AudioCue (BaseCue):
             return False
         # TODO
 
-    def setSource(self, filename: str) -> None:
+    def setSource(self, filename: str, load: bool = True) -> None:
+        # Without load, the media file is decoded on the first call to load
         self._filename = filename
         self._startsAt = 0.0
         self._endsAt = 0.0
         self._fade = Fade()
         self._loop = 0
-        self._audioPoints = []
+        self._peaks: Optional[PeakPyramid] = None
         self._volume = Volume()
+        # Default routing of the source channels to the outputs when None
+        self._routing: Optional[list[list[float]]] = None
+        self._loadProgress = 0
+        self._loadError = ''
+        self._contentHash: Optional[str] = None
         if self.player:
             self.player.quit()
-        self.audio: AudioSegment = AudioSegment.from_file(self._filename)
-        self.cueInfo = CueInfo(
-            QFileInfo(self._filename).fileName(),
-            self.audio.duration_seconds,
-            0
-        )
-        audio1000Hz, _ = self.audio.set_frame_rate(1000).split_to_mono()
-        samples = audio1000Hz.get_array_of_samples()
-        buffer = array.array(audio1000Hz.array_type, samples)
-        time = np.linspace(
-            0,
-            len(buffer) / audio1000Hz.frame_rate,
-            num=len(buffer)
-        )
-        self._audioPoints = np.stack((time, buffer), axis=-1).tolist()
-        self._startsAt = 0.0
-        self._endsAt = self.audio.duration_seconds
-        self.player = Player(self.audio)
+            self.player = None
+        if self._loader:
+            self._loader.cancel()
+            self._loader = None
+        self.cueInfo = CueInfo(QFileInfo(self._filename).fileName(), 0.0, 0)
+        if load:
+            self.load()
+
+    def load(self) -> None:
+        # The cue is listed at once, and can be played when loaded
+        if self.player or self._loader:
+            return
+        self._loadProgress = 0
+        self._loadError = ''
+        self._loader = AudioLoader(self._filename)
+        self._loader.progress.connect(self._setLoadProgress)
+        self._loader.finished.connect(self._audioLoaded)
+        self._loader.failed.connect(self._audioFailed)
+        self._loader.start()
+        self.loadingChanged.emit(self._loadProgress)
+
+    def isLoaded(self) -> bool:
+        return self.player is not None
+
+    def isLoading(self) -> bool:
+        return self._loader is not None
+
+    def loadProgress(self) -> int:
+        return self._loadProgress
+
+    def loadError(self) -> str:
+        return self._loadError
+
+    @Slot(int)
+    def _setLoadProgress(self, percent: int) -> None:
+        if self.sender() is not self._loader:
+            return
+        self._loadProgress = percent
+        self.loadingChanged.emit(percent)
+
+    @Slot(object)
+    def _audioLoaded(self, audio: AudioData) -> None:
+        if self.sender() is not self._loader:
+            # Media file changed meanwhile
+            if audio.buffer is not None:
+                audio.buffer.release()
+            return
+        self._loader = None
+        self._loadProgress = 100
+        self.cueInfo.duration = audio.duration
+        self._peaks = audio.peaks
+        # Start and end restored from a show file are kept
+        if not 0.0 < self._endsAt <= audio.duration:
+            self._endsAt = audio.duration
+        self._startsAt = min(self._startsAt, self._endsAt)
+        if self._contentHash and audio.contentHash and audio.contentHash != self._contentHash:
+            logger.warning(f'{self.getName()}: "{self._filename}" changed since the show was saved')
+        self._contentHash = audio.contentHash or self._contentHash
+        if audio.buffer is None:
+            self.player = Player(self._filename, frames=audio.frames, channels=audio.channels)
+        else:
+            self.player = Player(audio.buffer)
         self.player.changedState.connect(self.setPlayerState)
         self.player.elapsedTime.connect(self.duration)
-        self.player.start()
+        # Settings may have been changed while loading
         self.player.setLoop(self.getLoop())
         self.player.setStart(self.getStartsAt())
         self.player.setEnd(self.getEndsAt())
+        self.player.setVolume(self.getVolume())
+        self.player.setFade(self.getFadeDuration())
+        if self._routing is not None:
+            self.player.setRouting(self._routing)
+        self.player.arm()
         logger.debug('Player created')
-    
-    def getAudioPoints(self):
-        return self._audioPoints
+        self.loaded.emit()
+        self.changedCue.emit(self.cueInfo)
+
+    @Slot(str)
+    def _audioFailed(self, error: str) -> None:
+        if self.sender() is not self._loader:
+            return
+        self._loader = None
+        self._loadError = error
+        self.loadingChanged.emit(self._loadProgress)
+
+    def getAudioPoints(self, width: int) -> PeakLevel:
+        # Waveform peaks with about one bucket per pixel of width
+        return self._peaks.level(width)
 
     @Slot(int)
     def setLoop(self, value: int) -> None:
@@ -101,7 +175,8 @@ class AudioCue (BaseCue):
             self._loop = 0
         else:
             self._loop = value
-        self.player.setLoop(value)
+        if self.player:
+            self.player.setLoop(value)
 
     def getLoop(self):
         return self._loop
@@ -118,11 +193,16 @@ class AudioCue (BaseCue):
 
     @Slot()
     def play(self):
-        self.player.play()
+        if self.player:
+            self.player.play()
+        else:
+            logger.warning(f'{self.getName()}: not loaded yet')
+            self.load()
 
     @Slot()
     def pause(self):
-        self.player.pause()
+        if self.player:
+            self.player.pause()
 
     @Slot(PlayerStates)
     def setPlayerState(self, state: PlayerStates):
@@ -134,7 +214,8 @@ class AudioCue (BaseCue):
     @Slot(float)
     def setStartsAs(self, ms: float) -> None:
         self._startsAt = self._convertStartOrEndValue(ms)
-        self.player.setStart(self._startsAt)
+        if self.player:
+            self.player.setStart(self._startsAt)
 
     def getEndsAt(self) -> float:
         return self._endsAt
@@ -142,19 +223,21 @@ class AudioCue (BaseCue):
     @Slot(float)
     def setEndsAt(self, ms: float) -> None:
         self._endsAt = self._convertStartOrEndValue(ms)
-        self.player.setEnd(self._endsAt)
+        if self.player:
+            self.player.setEnd(self._endsAt)
 
     def _convertStartOrEndValue(self, seconds: float):
         if seconds < 0.0:
             return 0.0
-        if seconds > self.audio.duration_seconds:
-            return self.audio.duration_seconds
+        if seconds > self.cueInfo.duration:
+            return self.cueInfo.duration
         return seconds
 
     @Slot(Fade)
     def setFadeDuration(self, fade: Fade) -> None:
         self._fade = fade
-        self.player.setFade(fade)
+        if self.player:
+            self.player.setFade(fade)
 
     def getFadeDuration(self) -> Fade:
         return self._fade
@@ -165,11 +248,31 @@ class AudioCue (BaseCue):
     @Slot(Volume)
     def setVolume(self, volume: Volume) -> None:
         self._volume = volume
-        self.player.setVolume(volume)
+        if self.player:
+            self.player.setVolume(volume)
+
+    def getRouting(self) -> Optional[list[list[float]]]:
+        return self._routing
+
+    def setRouting(self, routing: Optional[list[list[float]]]) -> None:
+        # Gain of each source channel (rows) on each output channel (columns)
+        self._routing = routing
+        if self.player:
+            self.player.setRouting(routing)
 
     def getName(self) -> str:
         return self.cueInfo.name
 
+    def getFilename(self) -> str:
+        return self._filename
+
+    def getContentHash(self) -> Optional[str]:
+        return self._contentHash
+
+    def setContentHash(self, value: Optional[str]) -> None:
+        # Hash saved with the show, compared to the media file once loaded
+        self._contentHash = value
+
     def getFullDescription(self) -> str:
         return QFileInfo(self._filename).absoluteFilePath()
 
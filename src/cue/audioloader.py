@@ -0,0 +1,194 @@
+import logging
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+from PySide6.QtCore import QObject, QThread, QThreadPool, Signal
+
+from cue.peaks import PeakPyramid
+from engine.decoder import Decoder, WavDecoder, openDecoder
+from engine.pcmbuffer import PcmBuffer
+from engine.pcmcache import PcmCache
+from engine.player import MixerProcess
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Longer files are decoded while playing instead of being kept in memory
+STREAMING_THRESHOLD_KEY = 'Engine/streamingThreshold'
+STREAMING_THRESHOLD_DEFAULT = 300
+
+
+class LoadCancelled (Exception):
+    pass
+
+
+class AudioData:
+    def __init__(self, filename: str, frames: int, channels: int, buffer: Optional[PcmBuffer], peaks: PeakPyramid) -> None:
+        self.filename = filename
+        self.frames = frames
+        self.channels = channels
+        # None when the file is streamed by the player
+        self.buffer = buffer
+        self.peaks = peaks
+        # Set by the loader, saved in show files to detect changed media
+        self.contentHash: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.frames / MixerProcess.FRAME_RATE
+
+
+def loadAudio(
+    filename: str,
+    streamingThreshold: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> AudioData:
+    # Single pass over the file, one block in memory at a time: fill the
+    # player buffer and compute the waveform peaks. Compressed files are
+    # decoded only once, then memory mapped from the cache.
+    # progress is called with the frames done and the total after each block.
+    if streamingThreshold is None:
+        streamingThreshold = settings.value(STREAMING_THRESHOLD_KEY, STREAMING_THRESHOLD_DEFAULT, type=int)
+    frameRate = MixerProcess.FRAME_RATE
+    decoder = openDecoder(filename, frameRate)
+    try:
+        frames = decoder.frames
+        channels = decoder.channels
+        cache = PcmCache.instance()
+        # Long files are streamed whatever their format, they play without
+        # waiting to be decoded entirely. WAV files in mixer format are read
+        # directly, caching them is useless.
+        streamed = frames / frameRate > streamingThreshold
+        cacheable = not streamed and not isinstance(decoder, WavDecoder) and cache.accepts(frames, channels, np.int16)
+        if cacheable:
+            buffer = cache.load(filename, frameRate, channels)
+            if buffer is not None:
+                try:
+                    peaks = _peaks(_bufferBlocks(buffer), buffer.frames, progress)
+                except Exception:
+                    buffer.release()
+                    raise
+                return AudioData(filename, buffer.frames, channels, buffer, peaks)
+            buffer = cache.create(filename, frameRate, channels, frames, np.int16)
+        elif not streamed:
+            buffer = PcmBuffer.create(frames, channels, np.int16)
+        else:
+            buffer = None
+        try:
+            peaks = _peaks(_decodedBlocks(decoder, buffer), frames, progress)
+        except Exception:
+            if cacheable:
+                cache.discard(buffer)
+            elif buffer is not None:
+                buffer.release()
+            raise
+        if cacheable:
+            buffer = cache.store(buffer)
+        return AudioData(filename, frames, channels, buffer, peaks)
+    finally:
+        decoder.close()
+
+
+def _decodedBlocks(decoder: Decoder, buffer: Optional[PcmBuffer]) -> Iterator[tuple[int, np.ndarray]]:
+    for position, block in decoder.blocks():
+        block = block[:decoder.frames - position]
+        if buffer is not None:
+            buffer.samples[position:position + len(block)] = block
+        yield position, block
+
+
+def _bufferBlocks(buffer: PcmBuffer) -> Iterator[tuple[int, np.ndarray]]:
+    for position in range(0, buffer.frames, Decoder.BLOCK_SIZE):
+        yield position, buffer.read(position, Decoder.BLOCK_SIZE)
+
+
+def _peaks(
+    blocks: Iterator[tuple[int, np.ndarray]],
+    frames: int,
+    progress: Optional[Callable[[int, int], None]]
+) -> PeakPyramid:
+    peaks = PeakPyramid(frames, MixerProcess.FRAME_RATE)
+    for position, block in blocks:
+        peaks.add(position, block)
+        if progress is not None:
+            progress(position + len(block), frames)
+    return peaks.build()
+
+
+class AudioLoader (QObject):
+    # Loads a media file in a thread of the loader pool (one thread per core
+    # by default), so several cues are decoded at once without blocking the
+    # GUI. Signals are received in the thread of the loader owner.
+
+    # Threads decoding media files at once, 0 for one per core
+    THREADS_KEY = 'Engine/loaderThreads'
+    THREADS_DEFAULT = 0
+
+    _pool: Optional[QThreadPool] = None
+
+    progress = Signal(int, name='progress')
+    finished = Signal(object, name='finished')
+    failed = Signal(str, name='failed')
+
+    def __init__(self, filename: str) -> None:
+        super().__init__()
+        self.filename = filename
+        # Settings and cache are read here, from the GUI thread
+        self._streamingThreshold = settings.value(STREAMING_THRESHOLD_KEY, STREAMING_THRESHOLD_DEFAULT, type=int)
+        PcmCache.instance()
+        self._percent = -1
+        self._cancelled = False
+
+    @classmethod
+    def pool(cls) -> QThreadPool:
+        # Threads are started once and kept, loading a cue never waits for one
+        if cls._pool is None:
+            threads = settings.value(cls.THREADS_KEY, cls.THREADS_DEFAULT, type=int) or QThread.idealThreadCount()
+            cls._pool = QThreadPool()
+            cls._pool.setMaxThreadCount(threads)
+            cls._pool.setExpiryTimeout(-1)
+            logger.debug(f'Loading media files with {threads} threads')
+        return cls._pool
+
+    @classmethod
+    def waitForDone(cls, timeout: float) -> bool:
+        # Cancelled loaders stop after their current block,
+        # False if some are still running after timeout seconds
+        return cls._pool is None or cls._pool.waitForDone(round(timeout * 1000))
+
+    def start(self) -> None:
+        self.pool().start(self._run)
+
+    def cancel(self) -> None:
+        # The loading thread stops after the current block
+        self._cancelled = True
+
+    def _run(self) -> None:
+        try:
+            audio = loadAudio(self.filename, self._streamingThreshold, self._progress)
+        except LoadCancelled:
+            logger.debug(f'Loading of "{self.filename}" cancelled')
+            return
+        except Exception as e:
+            logger.error(f'Unable to load "{self.filename}": {e}')
+            self.failed.emit(str(e))
+            return
+        try:
+            # Read from the cache index unless the file is new or changed
+            audio.contentHash = PcmCache.instance().contentHash(self.filename)
+        except OSError as e:
+            logger.warning(f'Unable to hash "{self.filename}": {e}')
+        if self._cancelled:
+            if audio.buffer is not None:
+                audio.buffer.release()
+            return
+        self.finished.emit(audio)
+
+    def _progress(self, done: int, total: int) -> None:
+        if self._cancelled:
+            raise LoadCancelled()
+        # Only whole percents are sent to the GUI
+        percent = done * 100 // max(1, total)
+        if percent != self._percent:
+            self._percent = percent
+            self.progress.emit(percent)
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+
+
+class PeakLevel:
+    # Minimum and maximum of the samples of each bucket, at one zoom level
+    def __init__(self, bucketFrames: int, frames: int, frameRate: int, minimum: np.ndarray, maximum: np.ndarray) -> None:
+        self.bucketFrames = bucketFrames
+        self.frames = frames
+        self.frameRate = frameRate
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def __len__(self) -> int:
+        return len(self.minimum)
+
+    @property
+    def times(self) -> np.ndarray:
+        # Start time of each bucket in seconds
+        return np.arange(len(self), dtype=np.float64) * (self.bucketFrames / self.frameRate)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.frameRate
+
+    def fit(self, width: int) -> 'PeakLevel':
+        # Same peaks merged to have at most width buckets
+        factor = -(-len(self) // max(1, width))
+        if factor <= 1:
+            return self
+        padding = -len(self) % factor
+        minimum = np.pad(self.minimum, (0, padding), mode='edge').reshape(-1, factor).min(axis=1)
+        maximum = np.pad(self.maximum, (0, padding), mode='edge').reshape(-1, factor).max(axis=1)
+        return PeakLevel(self.bucketFrames * factor, self.frames, self.frameRate, minimum, maximum)
+
+
+class PeakPyramid:
+    # Waveform of the first channel as min/max peaks at several zoom levels,
+    # each level being FACTOR times coarser than the previous one.
+    # Built block by block while the file is read, blocks must start on a
+    # multiple of BUCKET_FRAMES (all but the last block are multiple of it).
+
+    BUCKET_FRAMES = 64
+    FACTOR = 4
+    # Coarsest level is the first one shorter than this
+    MIN_LENGTH = 256
+
+    def __init__(self, frames: int, frameRate: int) -> None:
+        self.frames = frames
+        self.frameRate = frameRate
+        buckets = max(1, math.ceil(frames / self.BUCKET_FRAMES))
+        self._minimum = np.zeros(buckets, dtype=np.int16)
+        self._maximum = np.zeros(buckets, dtype=np.int16)
+        self.levels: list[PeakLevel] = []
+
+    def add(self, position: int, block: np.ndarray) -> None:
+        samples = block[:, 0]
+        bucket = position // self.BUCKET_FRAMES
+        full = len(samples) // self.BUCKET_FRAMES
+        if full:
+            buckets = samples[:full * self.BUCKET_FRAMES].reshape(full, self.BUCKET_FRAMES)
+            self._minimum[bucket:bucket + full] = buckets.min(axis=1)
+            self._maximum[bucket:bucket + full] = buckets.max(axis=1)
+        rest = samples[full * self.BUCKET_FRAMES:]
+        if len(rest) and bucket + full < len(self._minimum):
+            self._minimum[bucket + full] = rest.min()
+            self._maximum[bucket + full] = rest.max()
+
+    def build(self) -> 'PeakPyramid':
+        # Coarser levels from the finest one, once every block is added
+        minimum, maximum = self._minimum, self._maximum
+        bucketFrames = self.BUCKET_FRAMES
+        self.levels = [PeakLevel(bucketFrames, self.frames, self.frameRate, minimum, maximum)]
+        while len(minimum) >= self.MIN_LENGTH:
+            padding = -len(minimum) % self.FACTOR
+            minimum = np.pad(minimum, (0, padding), mode='edge').reshape(-1, self.FACTOR).min(axis=1)
+            maximum = np.pad(maximum, (0, padding), mode='edge').reshape(-1, self.FACTOR).max(axis=1)
+            bucketFrames *= self.FACTOR
+            self.levels.append(PeakLevel(bucketFrames, self.frames, self.frameRate, minimum, maximum))
+        return self
+
+    def level(self, width: int) -> PeakLevel:
+        # Coarsest level still having a bucket for each of the width pixels
+        for level in reversed(self.levels):
+            if len(level) >= width:
+                return level
+        return self.levels[0]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.frameRate
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from cue.fade import Fade
+from cue.volume import Volume
+
+if TYPE_CHECKING:
+    from cue.audiocue import AudioCue
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.qsound'
+VERSION = 1
+
+
+class InvalidShow (Exception):
+    pass
+
+
+def saveShow(filename: str, cues: list['AudioCue']) -> None:
+    # Media paths are relative to the show file, so a show can be moved
+    # together with its media files
+    directory = os.path.dirname(os.path.abspath(filename))
+    show = {'version': VERSION, 'cues': [_cueToDict(cue, directory) for cue in cues]}
+    with open(filename + '.tmp', 'w') as file:
+        json.dump(show, file, indent=2)
+    os.replace(filename + '.tmp', filename)
+    logger.debug(f'Saved {len(cues)} cues to "{filename}"')
+
+
+def loadShow(filename: str) -> list['AudioCue']:
+    # Cues are created without decoding their media file, which is done
+    # when the cue is selected or played (see AudioCue.load)
+    try:
+        with open(filename) as file:
+            show = json.load(file)
+    except (OSError, ValueError) as e:
+        raise InvalidShow(f'Unable to read "{filename}": {e}') from e
+    if not isinstance(show, dict) or show.get('version') != VERSION:
+        raise InvalidShow(f'"{filename}" is not a show file')
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        cues = [_cueFromDict(data, directory) for data in show['cues']]
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidShow(f'Invalid cue in "{filename}": {e}') from e
+    logger.debug(f'Loaded {len(cues)} cues from "{filename}"')
+    return cues
+
+
+def _cueToDict(cue: 'AudioCue', directory: str) -> dict:
+    volume = cue.getVolume()
+    fade = cue.getFadeDuration()
+    return {
+        'path': _relativePath(cue.getFilename(), directory),
+        'contentHash': cue.getContentHash(),
+        'name': cue.getName(),
+        'duration': cue.cueInfo.duration,
+        'startsAt': cue.getStartsAt(),
+        'endsAt': cue.getEndsAt(),
+        'loop': cue.getLoop(),
+        'volume': {'master': volume.master, 'left': volume.left, 'right': volume.right},
+        'fade': {'fadeIn': fade.fadeIn, 'fadeOut': fade.fadeOut},
+        'routing': cue.getRouting(),
+    }
+
+
+def _cueFromDict(data: dict, directory: str) -> 'AudioCue':
+    # Audio engine is imported once a show is opened, not on startup
+    from cue.audiocue import AudioCue
+    cue = AudioCue(os.path.normpath(os.path.join(directory, data['path'])), load=False)
+    # Saved duration is shown in the cue list until the file is loaded
+    cue.cueInfo.duration = float(data['duration'])
+    cue.setName(str(data['name']))
+    cue.setLoop(int(data['loop']))
+    volume = data['volume']
+    cue.setVolume(Volume(float(volume['master']), float(volume['left']), float(volume['right'])))
+    fade = data['fade']
+    cue.setFadeDuration(Fade(float(fade['fadeIn']), float(fade['fadeOut'])))
+    cue.setEndsAt(float(data['endsAt']))
+    cue.setStartsAs(float(data['startsAt']))
+    routing = data.get('routing')
+    if routing is not None:
+        cue.setRouting([[float(gain) for gain in row] for row in routing])
+    cue.setContentHash(data.get('contentHash'))
+    return cue
+
+
+def _relativePath(filename: str, directory: str) -> str:
+    filename = os.path.abspath(filename)
+    try:
+        return os.path.relpath(filename, directory)
+    except ValueError:
+        # Other drive on Windows
+        return filename
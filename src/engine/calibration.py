@@ -0,0 +1,76 @@
+import logging
+from typing import Optional
+
+from engine.player import MixerProcess
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Output buffer sizes tried, in frames, from the smallest
+BUFFER_SIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+# Seconds of output measured for each size
+DURATION = 5.0
+
+
+class CalibrationResult:
+    def __init__(self, framesPerBuffer: int, underruns: int, jitter: float) -> None:
+        self.framesPerBuffer = framesPerBuffer
+        self.underruns = underruns
+        # Largest callback jitter, in ms
+        self.jitter = jitter
+
+    @property
+    def bufferDuration(self) -> float:
+        return self.framesPerBuffer * 1000.0 / MixerProcess.FRAME_RATE
+
+    def isStable(self) -> bool:
+        # The ring buffer holds one buffer in advance, a callback later
+        # than that would play silence
+        return self.underruns == 0 and self.jitter < self.bufferDuration / 2.0
+
+    def __str__(self) -> str:
+        state = 'stable' if self.isStable() else 'unstable'
+        return (
+            f'{self.framesPerBuffer:5d} frames ({self.bufferDuration:6.1f} ms): '
+            f'{self.underruns} underruns, {self.jitter:.2f} ms jitter, {state}'
+        )
+
+
+def measure(framesPerBuffer: int, duration: float = DURATION, voices: int = MixerProcess.CALIBRATION_VOICES) -> CalibrationResult:
+    # Chunks of one buffer, so the ring buffer holds two device buffers,
+    # rendered with voices cues playing as during a show, on the output
+    # and channels configured for the engine
+    mixer = MixerProcess.fromSettings(framesPerBuffer * 1000.0 / MixerProcess.FRAME_RATE, framesPerBuffer)
+    underruns, jitter = mixer.calibrate(duration, voices)
+    return CalibrationResult(framesPerBuffer, underruns, jitter)
+
+
+def calibrate(
+    sizes: tuple[int, ...] = BUFFER_SIZES,
+    duration: float = DURATION,
+    voices: int = MixerProcess.CALIBRATION_VOICES
+) -> Optional[CalibrationResult]:
+    # Smallest size stable under load is saved in the settings read by the engine
+    for size in sorted(sizes):
+        result = measure(size, duration, voices)
+        logger.info(result)
+        if result.isStable():
+            settings.setValue(MixerProcess.CHUNK_SIZE_KEY, result.bufferDuration)
+            settings.setValue(MixerProcess.FRAMES_PER_BUFFER_KEY, result.framesPerBuffer)
+            settings.sync()
+            return result
+    return None
+
+
+def main():
+    # Result of each size is logged
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    result = calibrate()
+    if result is None:
+        print('No stable buffer size found, settings unchanged')
+    else:
+        print(f'Saved {result.framesPerBuffer} frames per buffer ({result.bufferDuration:.1f} ms chunks)')
+
+
+if __name__ == '__main__':
+    main()
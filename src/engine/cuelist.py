@@ -2,14 +2,16 @@ from PySide6.QtCore import (
     QAbstractListModel, QObject, Qt, Slot,
     QModelIndex, QPersistentModelIndex
 )
-from typing import Optional, Union
-from cue.audiocue import AudioCue
+from typing import TYPE_CHECKING, Optional, Union
+
+if TYPE_CHECKING:
+    from cue.audiocue import AudioCue
 
 
 class CueListModel (QAbstractListModel):
     def __init__(
         self,
-        cuelist: Optional[list[AudioCue]] = None,
+        cuelist: Optional[list['AudioCue']] = None,
         parent: Optional[QObject] = None
     ) -> None:
         super().__init__(parent)
@@ -27,14 +29,40 @@ class CueListModel (QAbstractListModel):
             fadeOutText = f'\u2798 {fade.fadeOut:.02f}' if fade.fadeOut else ''
             loop = audiocue.getLoop()
             loopText = '\u21BA' if loop else ''
-            return f'{index.row()} - {audiocue.getName()} {fadeInText} [{audiocue.cueInfo.formatDuration()}] {fadeOutText} {loopText}'
+            if audiocue.loadError():
+                durationText = 'error'
+            elif audiocue.isLoading():
+                durationText = f'loading {audiocue.loadProgress()}%'
+            else:
+                durationText = audiocue.cueInfo.formatDuration()
+            return f'{index.row()} - {audiocue.getName()} {fadeInText} [{durationText}] {fadeOutText} {loopText}'
         if role == Qt.ItemDataRole.ToolTipRole:
+            if audiocue.loadError():
+                return f'{audiocue.getFullDescription()}\n{audiocue.loadError()}'
             return audiocue.getFullDescription()
 
-    def addCue(self, cue: AudioCue) -> None:
+    def addCue(self, cue: 'AudioCue') -> None:
         self._cuelist.append(cue)
+        cue.loadingChanged.connect(self.updateLayout)
+        cue.loaded.connect(self.updateLayout)
+        self.updateLayout()
+
+    def addCues(self, cues: list['AudioCue']) -> None:
+        # Layout is updated once for the whole list
+        self.blockSignals(True)
+        for cue in cues:
+            self.addCue(cue)
+        self.blockSignals(False)
         self.updateLayout()
 
+    def clear(self) -> None:
+        self.beginResetModel()
+        for cue in self._cuelist:
+            cue.quit()
+        self._cuelist = []
+        self.currentIndex = QModelIndex()
+        self.endResetModel()
+
     @Slot()
     def updateLayout(self):
         self.layoutChanged.emit()
@@ -74,11 +102,11 @@ class CueListModel (QAbstractListModel):
         self.endMoveRows()
         return True
 
-    def getCue(self, index: QModelIndex) -> AudioCue:
+    def getCue(self, index: QModelIndex) -> 'AudioCue':
         if index.isValid():
             return self._cuelist[index.row()]
         else:
             return None
 
-    def getAllCue(self) -> list[AudioCue]:
+    def getAllCue(self) -> list['AudioCue']:
         return self._cuelist
\ No newline at end of file
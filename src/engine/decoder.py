@@ -0,0 +1,210 @@
+import logging
+import subprocess
+import wave
+from typing import Iterator, Optional
+
+import numpy as np
+
+from engine.dsp import toInt16
+from engine.resampler import Resampler
+
+logger = logging.getLogger(__name__)
+
+
+class DecoderError(Exception):
+    pass
+
+
+class Decoder:
+    # Reads a media file by blocks of frames, converted to the mixer format
+    # (16 bits samples, frameRate). Channels are the ones of the file, they
+    # are routed to the outputs by the mixer. Only one block is in memory.
+
+    BLOCK_SIZE = 16384
+
+    def __init__(self, filename: str, frameRate: int) -> None:
+        self.filename = filename
+        self.frameRate = frameRate
+        self.channels = 0
+        self.frames = 0
+
+    def seek(self, frame: int) -> None:
+        raise NotImplementedError
+
+    def read(self, count: int) -> np.ndarray:
+        # Returns less than count frames at the end of the file
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def blocks(self) -> Iterator[tuple[int, np.ndarray]]:
+        # Every block of the file with its position, from the beginning
+        self.seek(0)
+        position = 0
+        while True:
+            block = self.read(self.BLOCK_SIZE)
+            if len(block) == 0:
+                break
+            yield position, block
+            position += len(block)
+
+
+class WavDecoder (Decoder):
+    # Reads WAV file samples directly, without ffmpeg.
+    # Only for 16 bits files at the mixer frame rate.
+
+    def __init__(self, filename: str, frameRate: int) -> None:
+        super().__init__(filename, frameRate)
+        try:
+            self._wav = wave.open(filename, 'rb')
+        except (wave.Error, EOFError) as e:
+            raise DecoderError(f'Unable to read "{filename}": {e}')
+        self.channels = self._wav.getnchannels()
+        self.frames = self._wav.getnframes()
+
+    @classmethod
+    def canRead(cls, filename: str, frameRate: int) -> bool:
+        try:
+            with wave.open(filename, 'rb') as wav:
+                return wav.getsampwidth() == 2 and wav.getframerate() == frameRate
+        except (wave.Error, EOFError, OSError):
+            return False
+
+    def seek(self, frame: int) -> None:
+        self._wav.setpos(min(frame, self.frames))
+
+    def read(self, count: int) -> np.ndarray:
+        data = self._wav.readframes(count)
+        return np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+
+    def close(self) -> None:
+        self._wav.close()
+
+
+class ConvertingWavDecoder (Decoder):
+    # Reads WAV files in any PCM format without ffmpeg: samples are converted
+    # to float, resampled to the mixer frame rate then converted back to
+    # 16 bits, one block at a time.
+
+    SAMPLE_WIDTHS = (1, 2, 3, 4)
+
+    def __init__(self, filename: str, frameRate: int) -> None:
+        super().__init__(filename, frameRate)
+        try:
+            self._wav = wave.open(filename, 'rb')
+        except (wave.Error, EOFError) as e:
+            raise DecoderError(f'Unable to read "{filename}": {e}')
+        self._sampleWidth = self._wav.getsampwidth()
+        self.channels = self._wav.getnchannels()
+        self._fileFrames = self._wav.getnframes()
+        fileRate = self._wav.getframerate()
+        self._resampler = Resampler(fileRate, frameRate) if fileRate != frameRate else None
+        self.frames = self._resampler.frames(self._fileFrames) if self._resampler else self._fileFrames
+        self._position = 0
+
+    @classmethod
+    def canRead(cls, filename: str) -> bool:
+        try:
+            with wave.open(filename, 'rb') as wav:
+                return wav.getsampwidth() in cls.SAMPLE_WIDTHS
+        except (wave.Error, EOFError, OSError):
+            return False
+
+    def seek(self, frame: int) -> None:
+        self._position = min(frame, self.frames)
+
+    def read(self, count: int) -> np.ndarray:
+        count = min(count, self.frames - self._position)
+        if count <= 0:
+            return np.zeros((0, self.channels), dtype=np.int16)
+        if self._resampler is None:
+            samples = self._readFloat(self._position, count)
+        else:
+            first, last = self._resampler.inputRange(self._position, count)
+            samples = self._resampler.resample(self._readFloat(first, last - first), first, self._position, count)
+        self._position += count
+        return toInt16(np.rint(samples * 32768.0))
+
+    def close(self) -> None:
+        self._wav.close()
+
+    def _readFloat(self, first: int, count: int) -> np.ndarray:
+        # File frames [first, first + count) in [-1, 1], zeros outside the file
+        samples = np.zeros((count, self.channels), dtype=np.float32)
+        start = max(first, 0)
+        end = min(first + count, self._fileFrames)
+        if end > start:
+            self._wav.setpos(start)
+            data = self._toFloat(self._wav.readframes(end - start))
+            samples[start - first:start - first + len(data)] = data
+        return samples
+
+    def _toFloat(self, data: bytes) -> np.ndarray:
+        if self._sampleWidth == 1:
+            # 8 bits samples are unsigned
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif self._sampleWidth == 3:
+            bytes24 = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            samples = (bytes24[:, 0] << 8 | bytes24[:, 1] << 16 | bytes24[:, 2] << 24) / np.float32(1 << 31)
+        else:
+            samples = np.frombuffer(data, dtype=f'<i{self._sampleWidth}') / np.float32(1 << (8 * self._sampleWidth - 1))
+        return samples.astype(np.float32, copy=False).reshape(-1, self.channels)
+
+
+class FfmpegDecoder (Decoder):
+    # Decodes any media file supported by ffmpeg through a pipe,
+    # ffmpeg resamples to the mixer format.
+
+    def __init__(self, filename: str, frameRate: int, frames: Optional[int] = None, channels: Optional[int] = None) -> None:
+        super().__init__(filename, frameRate)
+        self._process = None
+        if frames is not None and channels is not None:
+            # Already probed when the cue was loaded
+            self.frames = frames
+            self.channels = channels
+            return
+        # pydub looks for ffmpeg when imported, only done for compressed files
+        from pydub.utils import mediainfo
+        try:
+            info = mediainfo(filename)
+            self.frames = round(float(info['duration']) * frameRate)
+            self.channels = int(info['channels'])
+        except (OSError, KeyError, ValueError):
+            raise DecoderError(f'Unable to read "{filename}"')
+
+    def seek(self, frame: int) -> None:
+        from pydub import AudioSegment
+        self.close()
+        command = [
+            AudioSegment.converter, '-v', 'error',
+            '-ss', f'{frame / self.frameRate:.6f}', '-i', self.filename,
+            '-f', 's16le', '-acodec', 'pcm_s16le',
+            '-ar', str(self.frameRate), '-ac', str(self.channels), '-'
+        ]
+        logger.debug(f'Decoding "{self.filename}" from frame {frame}')
+        self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, count: int) -> np.ndarray:
+        if self._process is None:
+            self.seek(0)
+        frameWidth = 2 * self.channels
+        data = self._process.stdout.read(count * frameWidth)
+        data = data[:len(data) - len(data) % frameWidth]
+        return np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+
+    def close(self) -> None:
+        if self._process is not None:
+            self._process.stdout.close()
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+
+def openDecoder(filename: str, frameRate: int, frames: Optional[int] = None, channels: Optional[int] = None) -> Decoder:
+    # Known length and channels spare running ffprobe on compressed files
+    if WavDecoder.canRead(filename, frameRate):
+        return WavDecoder(filename, frameRate)
+    if ConvertingWavDecoder.canRead(filename):
+        return ConvertingWavDecoder(filename, frameRate)
+    return FfmpegDecoder(filename, frameRate, frames, channels)
@@ -0,0 +1,116 @@
+from typing import Optional
+
+import numpy as np
+
+from cue.fade import Fade
+from cue.volume import Volume
+
+
+def dbToGain(db: float) -> float:
+    if db <= Volume.MIN:
+        # Lowest volume value means silence
+        return 0.0
+    return 10.0 ** (db / 20.0)
+
+
+def outputGains(volume: Volume, channels: int) -> np.ndarray:
+    # Linear gain of each output channel, master included: left and right
+    # are the first two outputs, others only follow the master volume
+    master = dbToGain(volume.master)
+    gains = np.full(channels, master, dtype=np.float32)
+    if channels >= 2:
+        gains[0] *= dbToGain(volume.left)
+        gains[1] *= dbToGain(volume.right)
+    return gains
+
+
+# 5.1 (L, R, C, LFE, Ls, Rs) to stereo, without LFE
+SURROUND_DOWNMIX = np.array(
+    [[1.0, 0.0], [0.0, 1.0], [0.707, 0.707], [0.0, 0.0], [0.707, 0.0], [0.0, 0.707]],
+    dtype=np.float32
+)
+
+
+def defaultRouting(sourceChannels: int, outputChannels: int) -> np.ndarray:
+    # Gain of each source channel (rows) on each output channel (columns)
+    routing = np.zeros((sourceChannels, outputChannels), dtype=np.float32)
+    if sourceChannels == 1:
+        # Mono on left and right
+        routing[0, :2] = 1.0
+    elif outputChannels == 1:
+        routing[:, 0] = 1.0 / sourceChannels
+    elif routing.shape == SURROUND_DOWNMIX.shape:
+        routing[:] = SURROUND_DOWNMIX
+    else:
+        # Channel to the output of same index, extra source channels are dropped
+        np.fill_diagonal(routing, 1.0)
+    return routing
+
+
+def fadeEnvelope(
+    position: int, frames: int, starts: int, ends: int, fade: Fade, frameRate: int
+) -> Optional[np.ndarray]:
+    # Gain of each frame of the chunk beginning at position (in frames),
+    # linear ramps after starts and before ends like pydub fade.
+    # None when the chunk is outside both fades.
+    fadeIn = round(fade.fadeIn * frameRate)
+    fadeOut = round(fade.fadeOut * frameRate)
+    inFadeIn = fadeIn and position < starts + fadeIn
+    inFadeOut = fadeOut and position + frames > ends - fadeOut
+    if not inFadeIn and not inFadeOut:
+        return None
+    # Ramps from offsets in the chunk, in float64: float32 absolute positions
+    # lose precision after 2^24 frames, fades of long files would be stepped
+    offsets = np.arange(frames, dtype=np.float64)
+    envelope = np.ones(frames, dtype=np.float64)
+    if inFadeIn:
+        np.minimum(envelope, (offsets + (position - starts)) / fadeIn, out=envelope)
+    if inFadeOut:
+        np.minimum(envelope, ((ends - position) - offsets) / fadeOut, out=envelope)
+    return np.clip(envelope, 0.0, 1.0, out=envelope).astype(np.float32)
+
+
+def mixInto(mix: np.ndarray, samples: np.ndarray, gains: np.ndarray, envelope: Optional[np.ndarray] = None) -> None:
+    # samples is a (frames, channels) view of the source: one multiply
+    # per chunk, no channel split. The fade envelope only costs a second
+    # multiply on chunks inside a fade.
+    frames = len(samples)
+    if envelope is None:
+        mix[:frames] += samples * gains[:frames]
+    else:
+        mix[:frames] += samples * (gains[:frames] * envelope[:frames, np.newaxis])
+
+
+def toInt16(mix: np.ndarray) -> np.ndarray:
+    return np.clip(mix, -32768, 32767).astype(np.int16)
+
+
+class GainStage:
+    # Gains from the source channels to the output channels: the routing
+    # matrix with the volume of each output applied. For mono sources and
+    # when every source channel goes to the output of same index (the usual
+    # cases), gains are applied per output channel as before, a multiply
+    # being much faster than a matrix product on so few channels. Other
+    # routings cost one matrix product per chunk.
+
+    def __init__(self, routing: np.ndarray, volume: Volume, frames: int) -> None:
+        self.matrix = routing * outputGains(volume, routing.shape[1])
+        self._gains: Optional[np.ndarray] = None
+        # Mono samples are repeated on each output, twice faster than broadcasting
+        self._spread = len(self.matrix) == 1
+        if self._spread:
+            self._gains = np.tile(self.matrix[0], (frames, 1))
+        elif self.matrix.shape[0] == self.matrix.shape[1] and np.array_equal(self.matrix, np.diag(np.diag(self.matrix))):
+            self._gains = np.tile(np.diag(self.matrix), (frames, 1))
+
+    def mixInto(self, mix: np.ndarray, samples: np.ndarray, envelope: Optional[np.ndarray] = None) -> None:
+        if self._gains is not None:
+            if self._spread:
+                samples = np.repeat(samples, self.matrix.shape[1], axis=1)
+            mixInto(mix, samples, self._gains, envelope)
+            return
+        frames = len(samples)
+        routed = samples @ self.matrix
+        if envelope is not None:
+            routed *= envelope[:frames, np.newaxis]
+        mix[:frames] += routed
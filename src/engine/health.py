@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from engine.pcmbuffer import SHARED_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+
+class HealthStats:
+    # Audio health of the mixer process: counters and histograms written by
+    # the mixer while it plays, read by the GUI, in a memory mapped file
+    # shared by both like the play positions. Everything is allocated once;
+    # recording a value only increments a preallocated int64. Values are
+    # single aligned words, the reader never needs a consistent snapshot.
+
+    # Counters: underruns when the ring buffer has no frames for the output,
+    # device underruns when the device itself missed frames
+    CHUNKS, UNDERRUNS, COMMANDS, DEVICE_UNDERRUNS = range(4)
+    COUNTERS = ('chunks', 'underruns', 'commands', 'device underruns')
+    # Histograms: render time of a chunk and IPC latency in µs, commands
+    # waiting when the mixer wakes up
+    RENDER, QUEUE, IPC = range(3)
+    HISTOGRAMS = ('render', 'queue', 'ipc')
+    UNITS = ('µs', 'commands', 'µs')
+    # Bucket n counts values below 2^n and at least 2^(n-1), the last one
+    # everything above
+    BUCKETS = 24
+
+    def __init__(self, data: Optional[np.ndarray] = None, path: str = '', owner: bool = False) -> None:
+        # Without data, stats are local to the process
+        if data is None:
+            data = np.zeros(self.size(), dtype=np.int64)
+        self._path = path
+        self._owner = owner
+        self._data: Optional[np.ndarray] = data
+        self._counters = data[:len(self.COUNTERS)]
+        self._maxima = data[len(self.COUNTERS):len(self.COUNTERS) + len(self.HISTOGRAMS)]
+        self._histograms = data[len(self.COUNTERS) + len(self.HISTOGRAMS):].reshape(len(self.HISTOGRAMS), self.BUCKETS)
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls.COUNTERS) + len(cls.HISTOGRAMS) * (1 + cls.BUCKETS)
+
+    @classmethod
+    def create(cls) -> 'HealthStats':
+        fd, path = tempfile.mkstemp(prefix='qsound-health-', suffix='.npy', dir=SHARED_DIRECTORY)
+        os.close(fd)
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=np.int64, shape=(cls.size(),))
+        return cls(data, path, owner=True)
+
+    @classmethod
+    def attach(cls, path: str) -> 'HealthStats':
+        return cls(np.load(path, mmap_mode='r+'), path)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def count(self, counter: int, increment: int = 1) -> None:
+        self._counters[counter] += increment
+
+    def record(self, histogram: int, value: int) -> None:
+        value = max(0, value)
+        self._histograms[histogram, min(value.bit_length(), self.BUCKETS - 1)] += 1
+        if value > self._maxima[histogram]:
+            self._maxima[histogram] = value
+
+    def counter(self, counter: int) -> int:
+        return int(self._counters[counter])
+
+    def maximum(self, histogram: int) -> int:
+        return int(self._maxima[histogram])
+
+    def percentile(self, histogram: int, fraction: float) -> int:
+        # Upper bound of the bucket holding this fraction of the values
+        counts = self._histograms[histogram].copy()
+        total = int(counts.sum())
+        if not total:
+            return 0
+        bucket = int(np.searchsorted(np.cumsum(counts), fraction * total))
+        return min(1 << bucket, self.maximum(histogram))
+
+    def reset(self) -> None:
+        self._data[:] = 0
+
+    def summary(self) -> dict:
+        return {
+            'counters': {name: self.counter(index) for index, name in enumerate(self.COUNTERS)},
+            'histograms': {
+                name: {
+                    'unit': self.UNITS[index],
+                    'median': self.percentile(index, 0.5),
+                    'p99': self.percentile(index, 0.99),
+                    'max': self.maximum(index),
+                    'buckets': self._histograms[index].tolist(),
+                }
+                for index, name in enumerate(self.HISTOGRAMS)
+            },
+        }
+
+    def dump(self, filename: str) -> None:
+        with open(filename, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        logger.debug(f'Audio health saved to "{filename}"')
+
+    def release(self) -> None:
+        if self._data is None:
+            return
+        self._data = None
+        self._counters = self._maxima = self._histograms = None
+        if self._owner:
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,46 @@
+import os
+import select
+from multiprocessing import Pipe
+from typing import Optional
+
+
+class MessagePipe:
+    # One way channel of small binary messages between two processes.
+    # Each message is written at once, so with a non blocking writer a full
+    # pipe drops the whole message and never a part of it.
+
+    def __init__(self, blockingWrite: bool = True) -> None:
+        self._reader, self._writer = Pipe(duplex=False)
+        if not blockingWrite:
+            os.set_blocking(self._writer.fileno(), False)
+
+    def closeReader(self) -> None:
+        # Each process closes the end it does not use, so that
+        # the other end sees when the process is gone
+        self._reader.close()
+
+    def closeWriter(self) -> None:
+        self._writer.close()
+
+    def fileno(self) -> int:
+        # Readable when a message is waiting
+        return self._reader.fileno()
+
+    def send(self, message: bytes, timeout: Optional[float] = None) -> bool:
+        # False when the pipe is full and the writer does not block, or is
+        # still full after timeout seconds, or when the reading process is gone.
+        # Messages are smaller than PIPE_BUF, once writable one never blocks.
+        if timeout is not None and not select.select([], [self._writer], [], timeout)[1]:
+            return False
+        try:
+            self._writer.send_bytes(message)
+        except (BlockingIOError, BrokenPipeError):
+            return False
+        return True
+
+    def receive(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        # Wait at most timeout seconds (forever when None), None if nothing came.
+        # Raise EOFError once the writing process is gone.
+        if not self._reader.poll(timeout):
+            return None
+        return self._reader.recv_bytes()
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+import wave
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Called by the output for each buffer with the number of frames wanted and
+# whether the device missed frames since the previous buffer, returns the
+# 16 bits frames to play
+OutputCallback = Callable[[int, bool], np.ndarray]
+
+
+class Output:
+    # Where the mixer process plays to. Outputs are created in the GUI
+    # process and opened in the mixer one. A real time output calls the
+    # mixer back from its own thread once per buffer, like a sound card;
+    # otherwise the mixer loop makes it play what is queued (advance), as
+    # fast as chunks are rendered.
+
+    SAMPLE_WIDTH = 2
+    FRAMES_PER_BUFFER_DEFAULT = 1024
+
+    def __init__(self, realTime: bool = True) -> None:
+        self.realTime = realTime
+        # Seconds between a frame given to the output and heard
+        self.latency = 0.0
+
+    def open(self, frameRate: int, channels: int, framesPerBuffer: int, callback: OutputCallback) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def clock(self) -> float:
+        # Time of the output, in seconds of the monotonic clock when real time
+        return time.monotonic()
+
+    def advance(self, frames: int) -> None:
+        # Play frames at once, for outputs not in real time
+        pass
+
+
+class PyAudioOutput (Output):
+    # Sound card, through PortAudio
+
+    def open(self, frameRate: int, channels: int, framesPerBuffer: int, callback: OutputCallback) -> None:
+        # Only the mixer process needs PortAudio
+        from pyaudio import PyAudio, paContinue, paOutputOverflow, paOutputUnderflow
+        self._continue = paContinue
+        self._underflow = paOutputUnderflow | paOutputOverflow
+        self._callback = callback
+        self._player = PyAudio()
+        options = {}
+        if framesPerBuffer:
+            options['frames_per_buffer'] = framesPerBuffer
+        self._stream = self._player.open(
+            format=self._player.get_format_from_width(self.SAMPLE_WIDTH),
+            channels=channels,
+            rate=frameRate,
+            output=True,
+            stream_callback=self._play,
+            **options
+        )
+        self.latency = self._stream.get_output_latency()
+
+    def close(self) -> None:
+        self._stream.stop_stream()
+        self._stream.close()
+        self._player.terminate()
+
+    def _play(self, inData, frameCount: int, timeInfo: dict, status: int) -> tuple[bytes, int]:
+        return self._callback(frameCount, bool(status & self._underflow)).tobytes(), self._continue
+
+
+class NullOutput (Output):
+    # Output without device. Its clock is the duration of the frames played,
+    # from a thread in real time, or advanced by the mixer as fast as it
+    # renders. Played frames can be kept, for tests.
+
+    def __init__(self, realTime: bool = True, capture: bool = False) -> None:
+        super().__init__(realTime)
+        self.capture = capture
+        self.frames = 0
+        self._captured: list[np.ndarray] = []
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+
+    def open(self, frameRate: int, channels: int, framesPerBuffer: int, callback: OutputCallback) -> None:
+        self._frameRate = frameRate
+        self._channels = channels
+        self._framesPerBuffer = framesPerBuffer or self.FRAMES_PER_BUFFER_DEFAULT
+        self._callback = callback
+        self._start = time.monotonic()
+        if self.realTime:
+            self._running.set()
+            self._thread = threading.Thread(target=self._run, name='null output', daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._running.clear()
+            self._thread.join()
+            self._thread = None
+
+    def clock(self) -> float:
+        return self._start + self.frames / self._frameRate
+
+    def advance(self, frames: int) -> None:
+        while frames > 0:
+            count = min(frames, self._framesPerBuffer)
+            self._play(count)
+            frames -= count
+
+    def samples(self) -> np.ndarray:
+        # Every frame played, when captured
+        if not self._captured:
+            return np.zeros((0, self._channels), dtype=np.int16)
+        return np.concatenate(self._captured)
+
+    def _run(self) -> None:
+        while self._running.is_set():
+            # Next buffer is due when the previous one is played
+            delay = self.clock() - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._play(self._framesPerBuffer)
+
+    def _play(self, count: int) -> None:
+        samples = self._callback(count, False)
+        # Callback reuses its buffer
+        self.played(samples.copy() if self.capture else samples)
+        self.frames += count
+
+    def played(self, samples: np.ndarray) -> None:
+        if self.capture:
+            self._captured.append(samples)
+
+
+class WavFileOutput (NullOutput):
+    # Renders the output to a 16 bits WAV file
+
+    def __init__(self, filename: str, realTime: bool = False, capture: bool = False) -> None:
+        super().__init__(realTime, capture)
+        self.filename = filename
+        self._wav: Optional[wave.Wave_write] = None
+
+    def open(self, frameRate: int, channels: int, framesPerBuffer: int, callback: OutputCallback) -> None:
+        self._wav = wave.open(self.filename, 'wb')
+        self._wav.setnchannels(channels)
+        self._wav.setsampwidth(self.SAMPLE_WIDTH)
+        self._wav.setframerate(frameRate)
+        super().open(frameRate, channels, framesPerBuffer, callback)
+
+    def close(self) -> None:
+        super().close()
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+            logger.debug(f'{self.frames} frames written to "{self.filename}"')
+
+    def played(self, samples: np.ndarray) -> None:
+        super().played(samples)
+        self._wav.writeframes(samples.astype('<i2', copy=False).tobytes())
+
+
+def createOutput(name: str, filename: str = '', realTime: bool = True) -> Output:
+    # Output of the settings: 'device', 'null' or 'wav'
+    match name:
+        case 'null':
+            return NullOutput(realTime)
+        case 'wav':
+            return WavFileOutput(filename or 'qsound.wav', realTime)
+        case _:
+            return PyAudioOutput()
@@ -0,0 +1,67 @@
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Memory backed file system when available, so buffers never hit the disk
+SHARED_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class PcmBuffer:
+    # Decoded samples (frames x channels) stored in a memory mapped file.
+    # The GUI and the mixer process both map the same pages, nothing is copied.
+
+    def __init__(self, path: str, samples: np.ndarray, owner: bool) -> None:
+        self._path = path
+        self._samples: Optional[np.ndarray] = samples
+        self._owner = owner
+
+    @classmethod
+    def create(cls, frames: int, channels: int, dtype: np.dtype, path: Optional[str] = None) -> 'PcmBuffer':
+        # Without path, the buffer is a temporary file removed on release
+        owner = path is None
+        if owner:
+            fd, path = tempfile.mkstemp(prefix='qsound-', suffix='.npy', dir=SHARED_DIRECTORY)
+            os.close(fd)
+        samples = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(frames, channels))
+        logger.debug(f'Created PCM buffer "{path}" ({frames} frames, {channels} channels)')
+        return cls(path, samples, owner=owner)
+
+    @classmethod
+    def attach(cls, path: str) -> 'PcmBuffer':
+        return cls(path, np.load(path, mmap_mode='r'), owner=False)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def samples(self) -> np.ndarray:
+        return self._samples
+
+    @property
+    def frames(self) -> int:
+        return len(self._samples)
+
+    @property
+    def channels(self) -> int:
+        return self._samples.shape[1]
+
+    def read(self, position: int, count: int) -> np.ndarray:
+        return self._samples[position:position + count]
+
+    def release(self) -> None:
+        if self._samples is None:
+            return
+        # Drop the mapping, the memory is freed once every process released it
+        self._samples = None
+        if self._owner:
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
+            logger.debug(f'Released PCM buffer "{self._path}"')
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from PySide6.QtCore import QStandardPaths
+
+from engine.pcmbuffer import PcmBuffer
+from settings import APP_NAME, settings
+
+logger = logging.getLogger(__name__)
+
+
+class PcmCache:
+    # Decoded samples of compressed media files, kept on disk as .npy files
+    # and memory mapped on next loads instead of being decoded again.
+    # Files are named after the media content hash and the mixer format;
+    # the index only avoids hashing a file again when its path, size and
+    # modification time did not change. Least recently used files are
+    # removed when the cache grows over its size limit.
+
+    DIRECTORY_KEY = 'Cache/directory'
+    SIZE_LIMIT_KEY = 'Cache/sizeLimit'
+    SIZE_LIMIT_DEFAULT = 4096
+    INDEX = 'index.json'
+    HASH_BLOCK_SIZE = 1 << 20
+
+    _instance = None
+
+    def __init__(self, directory: str, sizeLimit: int) -> None:
+        self.directory = directory
+        self.sizeLimit = sizeLimit
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = self._readIndex()
+
+    @classmethod
+    def instance(cls) -> 'PcmCache':
+        if cls._instance is None:
+            location = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation)
+            directory = settings.value(cls.DIRECTORY_KEY, os.path.join(location, APP_NAME.lower(), 'pcm'))
+            # Size limit is set in MB
+            sizeLimit = settings.value(cls.SIZE_LIMIT_KEY, cls.SIZE_LIMIT_DEFAULT, type=int) * (1 << 20)
+            cls._instance = cls(directory, sizeLimit)
+        return cls._instance
+
+    def accepts(self, frames: int, channels: int, dtype: np.dtype) -> bool:
+        return frames * channels * np.dtype(dtype).itemsize <= self.sizeLimit
+
+    def load(self, filename: str, frameRate: int, channels: int) -> Optional[PcmBuffer]:
+        path = self._cachePath(filename, frameRate, channels)
+        try:
+            buffer = PcmBuffer.attach(path)
+        except (OSError, ValueError):
+            return None
+        # Last use time, for eviction
+        os.utime(path)
+        logger.debug(f'"{filename}" loaded from cache "{path}"')
+        return buffer
+
+    def create(self, filename: str, frameRate: int, channels: int, frames: int, dtype: np.dtype) -> PcmBuffer:
+        # Buffer to fill with decoded samples, then given to store
+        return PcmBuffer.create(frames, channels, dtype, path=self._cachePath(filename, frameRate, channels) + '.part')
+
+    def store(self, buffer: PcmBuffer) -> PcmBuffer:
+        buffer.samples.flush()
+        path = buffer.path.removesuffix('.part')
+        os.replace(buffer.path, path)
+        buffer.release()
+        self.evict(keep=path)
+        return PcmBuffer.attach(path)
+
+    def discard(self, buffer: PcmBuffer) -> None:
+        path = buffer.path
+        buffer.release()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.sizeLimit:
+                break
+            if path == keep:
+                continue
+            try:
+                # Cues still playing this file keep their mapping
+                os.remove(path)
+                total -= size
+                logger.debug(f'Evicted "{path}" from cache')
+            except FileNotFoundError:
+                pass
+
+    def purge(self) -> None:
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._index = {}
+            self._writeIndex()
+        logger.debug('Cache purged')
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _cachePath(self, filename: str, frameRate: int, channels: int) -> str:
+        return os.path.join(self.directory, f'{self.contentHash(filename)}-{frameRate}-{channels}.npy')
+
+    def contentHash(self, filename: str) -> str:
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        with self._lock:
+            entry = self._index.get(filename)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['hash']
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filename, 'rb') as file:
+            while data := file.read(self.HASH_BLOCK_SIZE):
+                digest.update(data)
+        contentHash = digest.hexdigest()
+        with self._lock:
+            self._index[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': contentHash}
+            self._writeIndex()
+        return contentHash
+
+    def _readIndex(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, self.INDEX)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _writeIndex(self) -> None:
+        path = os.path.join(self.directory, self.INDEX)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self._index, file)
+        os.replace(path + '.tmp', path)
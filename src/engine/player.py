@@ -1,15 +1,29 @@
+import json
 import logging
+import math
+import struct
+import time
+from collections import deque
 from enum import Enum
-from multiprocessing import Process, Queue
-from queue import Empty, Full
+from itertools import count
+from multiprocessing import Process
 from typing import Any, Optional
 
-from pyaudio import PyAudio
-from pydub import AudioSegment
-from PySide6.QtCore import QObject, QThread, Signal
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QObject, QSocketNotifier, QTimer, Signal, Slot
 
 from cue.fade import Fade
 from cue.volume import Volume
+from engine.dsp import GainStage, defaultRouting, fadeEnvelope, toInt16
+from engine.decoder import DecoderError
+from engine.health import HealthStats
+from engine.ipc import MessagePipe
+from engine.output import Output, PyAudioOutput, createOutput
+from engine.pcmbuffer import PcmBuffer
+from engine.positions import PositionTable
+from engine.ringbuffer import RingBuffer
+from engine.stream import AudioStream
+from settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +34,8 @@ class PlayerStates (Enum):
     Paused = 2
     Stopped = 3
     Ended = 4
+    # Stopped, with its first frames already rendered
+    Armed = 5
 
 
 class InvalidCommand(Exception):
@@ -34,13 +50,28 @@ class PlayerCommand:
     availableCommands = [
         'elapsedTime', 'state', 'quit',
         'pause', 'play', 'stop', 'volume', 'fade', 'loop',
-        'setStart', 'setEnd'
+        'setStart', 'setEnd', 'register', 'unregister', 'arm', 'routing'
     ]
+    # Binary layout: command index, value type, cue id (-1 for none),
+    # time sent (NaN for none), then the value in the layout of its type
+    HEADER = struct.Struct('<BBid')
+    VALUE_NONE, VALUE_INT, VALUE_FLOAT, VALUE_STATE, VALUE_VOLUME, VALUE_FADE, VALUE_JSON = range(7)
+    VALUE_LAYOUTS = {
+        VALUE_INT: struct.Struct('<q'),
+        VALUE_FLOAT: struct.Struct('<d'),
+        VALUE_STATE: struct.Struct('<B'),
+        VALUE_VOLUME: struct.Struct('<ddd'),
+        VALUE_FADE: struct.Struct('<dd'),
+    }
+    _commandIndexes = {command: index for index, command in enumerate(availableCommands)}
 
-    def __init__(self, command: str, value: Any | None = None) -> None:
+    def __init__(self, command: str, value: Any | None = None, cueId: int | None = None) -> None:
         if command in self.availableCommands:
             self.command = command
             self.value = value
+            self.cueId = cueId
+            # Monotonic clock time when sent, shared by both processes
+            self.sentAt: Optional[float] = None
         else:
             raise InvalidCommand
 
@@ -53,253 +84,948 @@ class PlayerCommand:
         except KeyError:
             raise InvalidMessage
         value = msg.get('value')
-        return cls(command, value)
+        cueId = msg.get('cue')
+        cmd = cls(command, value, cueId)
+        cmd.sentAt = msg.get('sentAt')
+        return cmd
 
     def toMessage(self):
+        msg = {'command': self.command}
         if self.value is not None:
-            return {'command': self.command, 'value': self.value}
+            msg['value'] = self.value
+        if self.cueId is not None:
+            msg['cue'] = self.cueId
+        if self.sentAt is not None:
+            msg['sentAt'] = self.sentAt
+        return msg
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        try:
+            index, valueType, cueId, sentAt = cls.HEADER.unpack_from(data)
+            command = cls.availableCommands[index]
+            if valueType == cls.VALUE_NONE:
+                value = None
+            elif valueType == cls.VALUE_JSON:
+                value = json.loads(data[cls.HEADER.size:])
+            else:
+                fields = cls.VALUE_LAYOUTS[valueType].unpack_from(data, cls.HEADER.size)
+                match valueType:
+                    case cls.VALUE_STATE:
+                        value = PlayerStates(fields[0])
+                    case cls.VALUE_VOLUME:
+                        value = Volume(*fields)
+                    case cls.VALUE_FADE:
+                        value = Fade(*fields)
+                    case _:
+                        value = fields[0]
+        except (struct.error, IndexError, KeyError, ValueError):
+            raise InvalidMessage
+        cmd = cls(command, value, None if cueId < 0 else cueId)
+        cmd.sentAt = None if math.isnan(sentAt) else sentAt
+        return cmd
+
+    def toBytes(self) -> bytes:
+        # Values sent often have a fixed layout, others are sent as JSON
+        value = self.value
+        if value is None:
+            valueType, payload = self.VALUE_NONE, ()
+        elif isinstance(value, PlayerStates):
+            valueType, payload = self.VALUE_STATE, (value.value,)
+        elif isinstance(value, Volume):
+            valueType, payload = self.VALUE_VOLUME, value.getVolume()
+        elif isinstance(value, Fade):
+            valueType, payload = self.VALUE_FADE, value.getFade()
+        elif isinstance(value, int) and not isinstance(value, bool):
+            valueType, payload = self.VALUE_INT, (value,)
+        elif isinstance(value, float):
+            valueType, payload = self.VALUE_FLOAT, (value,)
         else:
-            return {'command': self.command}
+            valueType, payload = self.VALUE_JSON, None
+        header = self.HEADER.pack(
+            self._commandIndexes[self.command],
+            valueType,
+            -1 if self.cueId is None else self.cueId,
+            math.nan if self.sentAt is None else self.sentAt
+        )
+        if payload is None:
+            return header + json.dumps(value).encode()
+        if valueType == self.VALUE_NONE:
+            return header
+        return header + self.VALUE_LAYOUTS[valueType].pack(*payload)
 
     def __str__(self) -> str:
+        if self.cueId is not None:
+            return f'"{self.command}" ({self.value}) for cue {self.cueId}'
         return f'"{self.command}" ({self.value})'
 
 
-class Player (QThread):
+class Engine (QObject):
+    # GUI side of the single mixer process shared by all cues. Messages of
+    # the mixer are read in the GUI event loop when its pipe becomes
+    # readable, no thread polls for them.
 
-    elapsedTime = Signal(int, name='elapsedTime')
-    changedState = Signal(PlayerStates, name='changedState')
+    _instance = None
+    # Most cues having a play position at once
+    POSITION_SLOTS = 1024
+    # Play positions are read at display rate while cues are playing
+    POSITION_INTERVAL = 16
+    # Audio health of the mixer is saved to this file on quit, when set
+    HEALTH_FILE_KEY = 'Engine/healthFile'
+    # Seconds given to the mixer process to stop, before it is terminated
+    QUIT_TIMEOUT = 2.0
+    # Longest wait of the GUI for room in the pipe to the mixer, in seconds
+    SEND_TIMEOUT = 0.05
 
-    def __init__(self, audio: AudioSegment, parent: Optional[QObject] = None) -> None:
+    def __init__(self, parent: Optional[QObject] = None) -> None:
         super().__init__(parent)
-        self._audio = audio
-        self._queueToProcess = Queue()
-        self._queueFromProcess = Queue()
-
-    def run(self):
-        logger.debug('Starting thread')
-        player = PlayerProcess(self._audio)
-        
-        process = Process(target=player.playerProcess, args=(self._queueToProcess, self._queueFromProcess))
-        process.start()
-        while not self.isInterruptionRequested():
+        self._pipeToProcess = MessagePipe()
+        # The mixer drops messages rather than waiting for the GUI
+        self._pipeFromProcess = MessagePipe(blockingWrite=False)
+        self._players: dict[int, Player] = {}
+        self._cueIds = count()
+        self._mixer = MixerProcess.fromSettings()
+        self._process: Optional[Process] = None
+        self._notifier: Optional[QSocketNotifier] = None
+        self._positions = PositionTable.create(self.POSITION_SLOTS)
+        self._health = HealthStats.create()
+        self._freeSlots = list(reversed(range(self.POSITION_SLOTS)))
+        self._slots: dict[int, int] = {}
+        self._playing: set[int] = set()
+        self._positionTimer = QTimer(self)
+        self._positionTimer.setInterval(self.POSITION_INTERVAL)
+        self._positionTimer.timeout.connect(self._readPositions)
+
+    @classmethod
+    def instance(cls) -> 'Engine':
+        if cls._instance is None:
+            cls._instance = cls()
+            app = QCoreApplication.instance()
+            if app is not None:
+                app.aboutToQuit.connect(cls._instance.quit)
+            cls._instance.start()
+        return cls._instance
+
+    def start(self) -> None:
+        logger.debug('Starting engine')
+        self._process = Process(
+            target=self._mixer.mixerProcess,
+            args=(self._pipeToProcess, self._pipeFromProcess, self._positions.path, self._health.path)
+        )
+        self._process.start()
+        self._pipeToProcess.closeReader()
+        self._pipeFromProcess.closeWriter()
+        self._notifier = QSocketNotifier(self._pipeFromProcess.fileno(), QSocketNotifier.Type.Read, self)
+        self._notifier.activated.connect(self._dispatch)
+
+    def isRunning(self) -> bool:
+        return self._process is not None
+
+    @classmethod
+    def current(cls) -> Optional['Engine']:
+        # Engine if already started, without starting it
+        return cls._instance
+
+    def health(self) -> HealthStats:
+        return self._health
+
+    def register(self, player: 'Player', source: dict) -> int:
+        cueId = next(self._cueIds)
+        self._players[cueId] = player
+        if self._freeSlots:
+            self._slots[cueId] = self._freeSlots.pop()
+            source = {**source, 'slot': self._slots[cueId]}
+        else:
+            logger.error(f'No play position available for cue {cueId}')
+        self.send(PlayerCommand('register', source, cueId))
+        return cueId
+
+    def unregister(self, cueId: int) -> None:
+        self._players.pop(cueId, None)
+        self._playing.discard(cueId)
+        self.send(PlayerCommand('unregister', cueId=cueId))
+        # Slot is free again once the mixer read the message
+        slot = self._slots.pop(cueId, None)
+        if slot is not None:
+            self._freeSlots.append(slot)
+
+    def send(self, command: PlayerCommand) -> None:
+        if self._process is None:
+            # Engine stopped, cues released after it have nothing to tell
+            return
+        command.sentAt = time.monotonic()
+        # A slow or hung mixer which does not read its messages makes the
+        # GUI wait a little, never freeze: the command is dropped
+        if not self._pipeToProcess.send(command.toBytes(), self.SEND_TIMEOUT):
+            logger.error(f'Mixer process does not read its messages, "{command.command}" dropped')
+
+    @Slot()
+    def _dispatch(self) -> None:
+        # Route every waiting message to the signals of its player
+        try:
+            self._dispatchMessages()
+        except EOFError:
+            logger.error('Mixer process stopped unexpectedly')
+            self._notifier.setEnabled(False)
+            # Positions of a dead mixer do not move any more
+            self._positionTimer.stop()
+            self._playing.clear()
+
+    def _dispatchMessages(self) -> None:
+        data = self._pipeFromProcess.receive(0)
+        while data is not None:
             try:
-                msg = PlayerCommand.fromMessage(self._queueFromProcess.get(block=True, timeout=0.5))
+                msg = PlayerCommand.fromBytes(data)
+            except (InvalidMessage, InvalidCommand):
+                logger.error('Wrong message received from mixer process')
+                msg = None
+            player = self._players.get(msg.cueId) if msg is not None else None
+            # No player when the cue is already removed
+            if player is not None:
                 match msg.command:
-                    case 'elapsedTime':
-                        logger.debug(f'Received command "elapsedTime" ({msg.value})')
-                        self.elapsedTime.emit(msg.value)
                     case 'state':
-                        logger.debug(f'Received command "state" ({msg.value})')
-                        self.changedState.emit(msg.value)
-            except (InvalidMessage):
-                logger.error(f'Wrong message: "{msg}"')
-            except Empty:
-                # No message received, nothing to do
-                pass
-        self._queueToProcess.put(PlayerCommand('quit').toMessage())
-        process.join()
+                        logger.debug(f'Received command "state" ({msg.value}) for cue {msg.cueId}')
+                        self._setPlaying(msg.cueId, msg.value == PlayerStates.Playing)
+                        player.changedState.emit(msg.value)
+            data = self._pipeFromProcess.receive(0)
+
+    def _setPlaying(self, cueId: int, playing: bool) -> None:
+        if playing:
+            self._playing.add(cueId)
+        else:
+            self._playing.discard(cueId)
+            # Last position, the cursor is rewound on stop
+            self._readPosition(cueId)
+        if self._playing and not self._positionTimer.isActive():
+            self._positionTimer.start()
+        elif not self._playing:
+            self._positionTimer.stop()
+
+    @Slot()
+    def _readPositions(self) -> None:
+        for cueId in self._playing:
+            self._readPosition(cueId)
+
+    def _readPosition(self, cueId: int) -> None:
+        slot = self._slots.get(cueId)
+        player = self._players.get(cueId)
+        if slot is None or player is None:
+            return
+        position, heardAt, state = self._positions.read(slot)
+        if state == PlayerStates.Playing.value:
+            # Position moved since written, at most by one chunk
+            elapsed = min(max(0.0, time.monotonic() - heardAt), self._mixer.chunkSize / 1000.0)
+            position += round(elapsed * MixerProcess.FRAME_RATE)
+        player.elapsedTime.emit(round(position * 1000.0 / MixerProcess.FRAME_RATE))
+
+    @Slot()
+    def quit(self):
+        if self._process is None:
+            return
+        self._notifier.setEnabled(False)
+        # Mixer process wakes up on the message and stops at once. A hung one
+        # may not read its messages any more, then the pipe is full and the
+        # message is dropped rather than blocking the GUI; it is stopped by a signal.
+        if not self._pipeToProcess.send(PlayerCommand('quit').toBytes(), self.QUIT_TIMEOUT):
+            logger.error('Mixer process does not read its messages')
+        self._process.join(self.QUIT_TIMEOUT)
+        if self._process.is_alive():
+            logger.error('Mixer process does not quit, terminating it')
+            self._process.terminate()
+            self._process.join(self.QUIT_TIMEOUT)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+        self._process = None
+        self._pipeToProcess.closeWriter()
+        self._pipeFromProcess.closeReader()
+        self._positionTimer.stop()
+        healthFile = settings.value(self.HEALTH_FILE_KEY, '', type=str)
+        if healthFile:
+            self._health.dump(healthFile)
+        self._health.release()
+        self._positions.release()
+
+
+class Player (QObject):
+
+    elapsedTime = Signal(int, name='elapsedTime')
+    changedState = Signal(PlayerStates, name='changedState')
+
+    READ_AHEAD_KEY = 'Engine/readAhead'
+    READ_AHEAD_DEFAULT = 5000
+
+    def __init__(
+        self, source: PcmBuffer | str, parent: Optional[QObject] = None, frames: int = 0, channels: int = 0
+    ) -> None:
+        # source is either a buffer already decoded in mixer format,
+        # or a media file name decoded while playing, whose length and
+        # channels are known by the loader
+        super().__init__(parent)
+        self._buffer = None
+        if isinstance(source, PcmBuffer):
+            self._buffer = source
+            # Only the buffer location is sent, the mixer process maps it
+            description = {'buffer': source.path}
+        else:
+            readAhead = settings.value(self.READ_AHEAD_KEY, self.READ_AHEAD_DEFAULT, type=int)
+            description = {
+                'stream': source,
+                'frames': frames,
+                'channels': channels,
+                'readAhead': round(readAhead * MixerProcess.FRAME_RATE / 1000.0)
+            }
+        self._engine = Engine.instance()
+        self._cueId = self._engine.register(self, description)
+
+    def _send(self, command: str, value: Any | None = None) -> None:
+        if self._cueId is not None:
+            self._engine.send(PlayerCommand(command, value, self._cueId))
 
     def pause(self):
-        self._queueToProcess.put(PlayerCommand('pause').toMessage())
+        self._send('pause')
 
     def play(self):
-        self._queueToProcess.put(PlayerCommand('play').toMessage())
+        self._send('play')
 
     def stop(self):
-        self._queueToProcess.put(PlayerCommand('stop').toMessage())
+        self._send('stop')
+
+    def arm(self):
+        # Keep the first frames rendered while stopped, for an instant GO
+        self._send('arm')
 
     def setVolume(self, volume: Volume):
-        self._queueToProcess.put(PlayerCommand('volume', volume).toMessage())
+        self._send('volume', volume)
 
     def setFade(self, fade: Fade):
-        self._queueToProcess.put(PlayerCommand('fade', fade).toMessage())
+        self._send('fade', fade)
 
     def setLoop(self, loop: int):
-        self._queueToProcess.put(PlayerCommand('loop', loop).toMessage())
+        self._send('loop', loop)
 
     def setStart(self, seconds: float):
-        self._queueToProcess.put(PlayerCommand('setStart', seconds).toMessage())
+        self._send('setStart', seconds)
 
     def setEnd(self, seconds: float):
-        self._queueToProcess.put(PlayerCommand('setEnd', seconds).toMessage())
+        self._send('setEnd', seconds)
 
-    def quit(self):
-        if self.isRunning():
-            self.requestInterruption()
-            while not self.isFinished():
-                # Wait end of process and thread
-                pass
+    def setRouting(self, routing: Optional[list[list[float]]]):
+        # Gain of each source channel (rows) on each output (columns),
+        # None for the default routing
+        self._send('routing', routing)
 
+    def quit(self):
+        if self._cueId is not None:
+            self._engine.unregister(self._cueId)
+            self._cueId = None
+            if self._buffer is not None:
+                self._buffer.release()
 
-class PlayerProcess:
 
-    CHUNK_SIZE = 100.0
+class Voice:
+    # Playing state of one cue inside the mixer process
 
-    def __init__(self, audio: AudioSegment):
-        self._audio = audio
-        self._startsMs = 0.0
-        self._endsMs = audio.duration_seconds * 1000.0
+    def __init__(
+        self,
+        cueId: int,
+        source: dict,
+        pipeOut: MessagePipe,
+        chunkSize: float,
+        positions: Optional[PositionTable] = None,
+        channels: Optional[int] = None
+    ):
+        self.cueId = cueId
+        self.pipeOut = pipeOut
+        # Record of the play position shared with the GUI
+        self._positions = positions
+        self._slot: Optional[int] = source.get('slot')
+        self._chunkFrames = round(MixerProcess.FRAME_RATE * chunkSize / 1000.0)
+        self._source = self._openSource(source)
+        # Output channels
+        self._channels = channels or MixerProcess.CHANNELS
+        # Play cursor and start and end points, in frames
+        self._position = 0
+        self._startFrame = 0
+        self._endFrame = self._source.frames
+        self._fade = Fade()
         self._loop = 0
         self._playerState = PlayerStates.NotStarted
         self._playerOldState = None
         self._volume = Volume()
-        self.lastSentElapsedTime = 0
+        self._routing = defaultRouting(self._source.channels, self._channels)
+        self._gains = GainStage(self._routing, self._volume, self._chunkFrames)
+        self._armed = False
+        # First frames from the start point, with volume and fade applied,
+        # enough to cover the frames queued for the audio callback
+        self._preroll: Optional[np.ndarray] = None
+        self._prerollFrames = MixerProcess.RING_CHUNKS * self._chunkFrames
+        # Frames mixed into the ring buffer, at the same place, from the
+        # absolute ring frames keptFrom to keptTo
+        self._kept: Optional[np.ndarray] = None
+        self._keptFrom = 0
+        self._keptTo = 0
+        self._rewind()
 
-    def playerProcess(self, queueIn: Queue, queueOut: Queue):
-        self.queueIn = queueIn
-        self.queueOut = queueOut
-        logger.debug('Starting player process')
-        try:
-            player = PyAudio()
-            stream = player.open(
-                format=player.get_format_from_width(self._audio.sample_width),
-                channels=self._audio.channels,
-                rate=self._audio.frame_rate,
-                output=True,
-            )
-            # Copy audio to not change it
-            audioToPlay = AudioSegment.empty() + self._audio
-            loop = self._loop
-            repeatInfiny = loop == -1
-            # Set playing at start cursor
-            elapsedTime = self._startsMs
-            self.lastSentElapsedTime = elapsedTime
-            logger.debug(f'Playing from {self._startsMs}ms to {self._endsMs}ms')
-            while True:
-                blocked = self._playerState != PlayerStates.Playing
-                try:
-                    msg = PlayerCommand.fromMessage(self.queueIn.get(block=blocked))
-                    logger.debug(f'Receive message from main app.: "{msg}"')
-                    match msg.command:
-                        case 'play':
-                            self.setPlayerState(PlayerStates.Playing)
-                        case 'pause':
-                            self.setPlayerState(PlayerStates.Paused)
-                        case 'stop':
-                            self.setPlayerState(PlayerStates.Stopped)
-                        case 'volume':
-                            self._volume: Volume = msg.value
-                        case 'fade':
-                            fade: Fade = msg.value
-                            self.setPlayerState(PlayerStates.Stopped)
-                            audioToPlay = self._applyFade(self._audio, fade)
-                        case 'loop':
-                            self._loop = msg.value
-                            self.setPlayerState(PlayerStates.Stopped)
-                        case 'setStart':
-                            self._startsMs = msg.value * 1000.0
-                            self.setPlayerState(PlayerStates.Stopped)
-                        case 'setEnd':
-                            self._endsMs = msg.value * 1000.0
-                            self.setPlayerState(PlayerStates.Stopped)
-                        case 'quit':
-                            self.setPlayerState(PlayerStates.Ended)
-                except InvalidMessage:
-                    logger.error(f'Wrong message: "{msg}"')
-                except Empty:
-                    # No message received, nothing to do
-                    pass
+    def execute(self, msg: PlayerCommand) -> None:
+        match msg.command:
+            case 'play':
+                self.setPlayerState(PlayerStates.Playing)
+            case 'pause':
+                self.setPlayerState(PlayerStates.Paused)
+            case 'stop':
+                self.stop()
+            case 'arm':
+                self._armed = True
+                if self._playerState not in (PlayerStates.Playing, PlayerStates.Paused):
+                    self._arm()
+            case 'volume':
+                self._volume: Volume = msg.value
+                self._gains = GainStage(self._routing, self._volume, self._chunkFrames)
+                self._rearm()
+            case 'routing':
+                self._setRouting(msg.value)
+                self._gains = GainStage(self._routing, self._volume, self._chunkFrames)
+                self._rearm()
+            case 'fade':
+                # Envelope is evaluated on each chunk, no need to stop
+                self._fade: Fade = msg.value
+                self._rearm()
+            case 'loop':
+                self._loop = msg.value
+                self.stop()
+            case 'setStart':
+                self._startFrame = self._toFrame(msg.value)
+                if isinstance(self._source, AudioStream):
+                    self._source.setStart(self._startFrame)
+                self.stop()
+            case 'setEnd':
+                self._endFrame = min(self._toFrame(msg.value), self._source.frames)
+                self.stop()
+
+    def isPlaying(self) -> bool:
+        return self._playerState == PlayerStates.Playing
+
+    def isArmed(self) -> bool:
+        return self._playerState == PlayerStates.Armed
+
+    def preroll(self, frames: int) -> Optional[np.ndarray]:
+        # Pre-rendered frames, None when there are not that many
+        if self._preroll is None or len(self._preroll) < frames:
+            return None
+        return self._preroll[:frames]
+
+    def go(self, skipped: int) -> None:
+        # Play an armed voice whose skipped first frames are already mixed
+        self._rewind()
+        self._position += skipped
+        self.setPlayerState(PlayerStates.Playing)
+
+    def keep(self, frame: int, samples: np.ndarray) -> None:
+        # Frames mixed into the ring buffer from its absolute frame
+        if self._kept is None:
+            self._kept = np.zeros((self._prerollFrames, self._channels), dtype=np.float32)
+        if frame != self._keptTo:
+            self._keptFrom = frame
+        begin = frame % len(self._kept)
+        first = min(len(samples), len(self._kept) - begin)
+        self._kept[begin:begin + first] = samples[:first]
+        self._kept[:len(samples) - first] = samples[first:]
+        self._keptTo = frame + len(samples)
+
+    def takeBack(self, start: int, end: int) -> tuple[int, Optional[np.ndarray]]:
+        # Frames mixed into the ring buffer from start to end, end being the
+        # last frame written, to be removed from it. The first one is later
+        # when the voice began after start. The cursor goes back to the first
+        # frame taken, played again on resume.
+        if self._kept is None or self._keptTo != end:
+            return end, None
+        start = max(start, self._keptFrom, end - len(self._kept))
+        if start >= end:
+            return end, None
+        samples = self._kept[np.arange(start, end) % len(self._kept)]
+        self._keptTo = start
+        self._position -= end - start
+        while self._position < self._startFrame < self._endFrame:
+            # Taken frames began in the previous loop
+            self._position += self._endFrame - self._startFrame
+            if self._loopsLeft != -1:
+                self._loopsLeft += 1
+        return start, samples
+
+    def stop(self) -> None:
+        self._rewind()
+        self.setPlayerState(PlayerStates.Stopped)
+        if self._armed:
+            self._arm()
+
+    def _arm(self) -> None:
+        start = self._startFrame
+        count = max(0, min(self._prerollFrames, self._endFrame - start))
+        if isinstance(self._source, AudioStream):
+            # Never waits for the decoder, GO plays without pre-roll instead
+            count = min(count, self._source.ready(start))
+        samples = self._read(start, count, time.monotonic())
+        self._preroll = np.zeros((len(samples), self._channels), dtype=np.float32)
+        envelope = fadeEnvelope(
+            start, len(samples),
+            start, self._endFrame,
+            self._fade, MixerProcess.FRAME_RATE
+        )
+        GainStage(self._routing, self._volume, len(samples)).mixInto(self._preroll, samples, envelope)
+        self.setPlayerState(PlayerStates.Armed)
 
-                if self.getPlayerState() == PlayerStates.Playing:
-                    if elapsedTime >= self._endsMs:
-                        if repeatInfiny or loop > 0:
-                            loop = loop - 1
-                            elapsedTime = self._startsMs
-                        else:
-                            self.setPlayerState(PlayerStates.Stopped)
-                            # Reset reading cursor and number of loops
-                            elapsedTime = self._startsMs
-                            loop = self._loop
-                            repeatInfiny = loop == -1
-                    else:
-                        segmentSize = min(self._endsMs, elapsedTime+self.CHUNK_SIZE)
-                        data = self._applyVolume(audioToPlay[elapsedTime:segmentSize], self._volume)
-                        self.sendElapsedTime(len(data) + elapsedTime)
-                        if len(data) == 0:
-                            if repeatInfiny or loop > 0:
-                                loop = loop - 1
-                                elapsedTime = self._startsMs
-                            else:
-                                self.setPlayerState(PlayerStates.Stopped)
-                                # Reset reading cursor and number of loops
-                                elapsedTime = self._startsMs
-                                loop = self._loop
-                                repeatInfiny = loop == -1
-                        else:
-                            self.setPlayerState(PlayerStates.Playing)
-                            stream.write(data.raw_data)
-                            elapsedTime += self.CHUNK_SIZE
-                elif self.getPlayerState() == PlayerStates.Ended:
-                    # Quit process
+    def _rearm(self) -> None:
+        # Pre-rendered frames follow volume and fade changes
+        if self.isArmed():
+            self._arm()
+
+    def release(self) -> None:
+        self._source.release()
+
+    def render(self, mix: np.ndarray, deadline: Optional[float] = None) -> int:
+        # Add the next frames to mix, wrapping to the start point inside
+        # the same chunk at the end of a loop. Return the number of frames
+        # written, less than the chunk when the cue ends. A streamed source
+        # plays silence for frames not decoded at deadline.
+        written = 0
+        restarted = False
+        while written < len(mix):
+            count = min(len(mix) - written, self._endFrame - self._position)
+            chunk = self._read(self._position, count, deadline) if count > 0 else None
+            if chunk is None or len(chunk) == 0:
+                # End point or end of media reached
+                if restarted:
+                    # Nothing to play between start and end points
+                    self.stop()
                     break
-                elif self.getPlayerState() == PlayerStates.Stopped:
-                    # Reset reading cursor and number of loops
-                    elapsedTime = self._startsMs
-                    loop = self._loop
-                    repeatInfiny = loop == -1
-                    self.sendElapsedTime(elapsedTime)
-        finally:
-            stream.stop_stream()
-            stream.close()
-            player.terminate()
-
-    def _applyVolume(self, audio: AudioSegment, volume: Volume) -> AudioSegment:
-        # Copy audio to not change it
-        segment = AudioSegment.empty() + audio
-        if volume.left or volume.right:
-            left, right = audio.split_to_mono()
-            if volume.left == Volume.MIN:
-                left = left - 120.0
-            else:
-                left = left + volume.left
-            if volume.right == Volume.MIN:
-                right = right - 120
-            else:
-                right = right + volume.right
-            segment = AudioSegment.from_mono_audiosegments(left, right)
-        if volume.master:
-            if volume.master == Volume.MIN:
-                segment = segment - 120
-            else:
-                segment = segment + volume.master
-        return segment
-
-    def _applyFade(self, audio: AudioSegment, fade: Fade) -> AudioSegment:
-        fadeIn = round(fade.fadeIn * 1000)
-        fadeOut = round(fade.fadeOut * 1000)
-        # Copy audio to not change it
-        segment = AudioSegment.empty() + audio
-        if fadeIn:
-            start = round(self._startsMs)
-            segment = segment.fade(to_gain=0, from_gain=-120, start=start, duration=fadeIn)
-        if fadeOut:
-            end = round(self._endsMs)
-            segment = segment.fade(to_gain=-120, from_gain=0, end=end, duration=fadeOut)
-        return segment
+                if not self._nextLoop():
+                    break
+                restarted = True
+                continue
+            restarted = False
+            envelope = fadeEnvelope(
+                self._position, len(chunk),
+                self._startFrame, self._endFrame,
+                self._fade, MixerProcess.FRAME_RATE
+            )
+            self._gains.mixInto(mix[written:], chunk, envelope)
+            written += len(chunk)
+            self._position += len(chunk)
+        return written
+
+    def publish(self, queued: int, heardAt: float) -> None:
+        # Cursor less the frames still queued for the output
+        if self._positions is None or self._slot is None:
+            return
+        position = max(self._startFrame, self._position - queued) if self.isPlaying() else self._position
+        self._positions.write(self._slot, position, heardAt, self._playerState.value)
+
+    def _openSource(self, source: dict) -> PcmBuffer | AudioStream:
+        if 'stream' in source:
+            return AudioStream(
+                source['stream'], MixerProcess.FRAME_RATE, source['readAhead'], source['frames'], source['channels']
+            )
+        return PcmBuffer.attach(source['buffer'])
+
+    def _read(self, position: int, count: int, deadline: Optional[float] = None) -> np.ndarray:
+        if isinstance(self._source, AudioStream):
+            return self._source.read(position, count, deadline)
+        return self._source.read(position, count)
+
+    def _setRouting(self, routing: Optional[list[list[float]]]) -> None:
+        shape = (self._source.channels, self._channels)
+        if routing is None:
+            self._routing = defaultRouting(*shape)
+            return
+        matrix = np.array(routing, dtype=np.float32)
+        if matrix.shape != shape:
+            logger.error(f'Routing of cue {self.cueId} is {matrix.shape}, expected {shape}: ignored')
+            return
+        self._routing = matrix
+
+    def _toFrame(self, seconds: float) -> int:
+        return max(0, round(seconds * MixerProcess.FRAME_RATE))
+
+    def _rewind(self) -> None:
+        # Reset reading cursor and number of loops
+        self._position = self._startFrame
+        self._loopsLeft = self._loop
+
+    def _nextLoop(self) -> bool:
+        if self._loopsLeft == -1 or self._loopsLeft > 0:
+            if self._loopsLeft > 0:
+                self._loopsLeft -= 1
+            self._position = self._startFrame
+            return True
+        self.stop()
+        return False
 
     def setPlayerState(self, state: PlayerStates) -> None:
         self._playerState = state
         if self._playerOldState != self._playerState:
             self._playerOldState = state
-            try:
-                self.queueOut.put_nowait({'command': 'state', 'value': self._playerState})
-            except Full:
-                # Impossible to send player state, quit player
-                self._state = PlayerStates.Ended
+            # Position record is up to date before the GUI gets the state
+            self.publish(0, time.monotonic())
+            if not self.pipeOut.send(PlayerCommand('state', self._playerState, self.cueId).toBytes()):
+                # Impossible to send player state
+                logger.error(f'Unable to send state of cue {self.cueId}')
 
     def getPlayerState(self) -> PlayerStates:
         return self._playerState
 
-    def sendElapsedTime(self, elapsedTime: int) -> None:
-        # Send elapsedTime only every 250ms
-        if abs(elapsedTime - self.lastSentElapsedTime) > 250:
-            try:
-                self.queueOut.put_nowait({'command': 'elapsedTime', 'value': elapsedTime})
-            except Full:
-                # Impossible to send elapsed time
-                # This is not a blocking point
-                pass
-            finally:
-                self.lastSentElapsedTime = elapsedTime
 
+class MixerProcess:
+    # Owns the only output stream and mixes all playing cues into it.
+    # The mixer loop renders chunks into a ring buffer kept full while cues
+    # are playing, and the audio callback only copies frames out of it, so
+    # commands are handled between chunks without ever blocking the output.
+
+    FRAME_RATE = 44100
+    CHANNELS = 2
+    # Chunks rendered ahead of the audio callback
+    RING_CHUNKS = 2
+    # Commands whose delay until heard is measured
+    TIMED_COMMANDS = ('play', 'pause', 'stop')
+    # Seconds of output ignored by calibration, while the stream starts
+    CALIBRATION_SETTLING = 0.5
+    # Cues playing at once while calibrating
+    CALIBRATION_VOICES = 8
+    # Duration of audio rendered at once, in ms
+    CHUNK_SIZE_KEY = 'Engine/chunkSize'
+    CHUNK_SIZE_DEFAULT = 100.0
+    # Frames per buffer of the output device, 0 lets the output choose
+    FRAMES_PER_BUFFER_KEY = 'Engine/framesPerBuffer'
+    FRAMES_PER_BUFFER_DEFAULT = 0
+    # Output channels of the device, cues are routed to them
+    CHANNELS_KEY = 'Engine/channels'
+    # Where the mix is played: 'device', 'null' or 'wav'
+    OUTPUT_KEY = 'Engine/output'
+    OUTPUT_DEFAULT = 'device'
+    OUTPUT_FILE_KEY = 'Engine/outputFile'
+    # Whether a null or wav output plays in real time or as fast as possible
+    REAL_TIME_KEY = 'Engine/realTime'
+
+    def __init__(
+        self,
+        chunkSize: float = CHUNK_SIZE_DEFAULT,
+        framesPerBuffer: int = FRAMES_PER_BUFFER_DEFAULT,
+        channels: int = CHANNELS,
+        output: Optional[Output] = None
+    ):
+        self.chunkSize = chunkSize
+        self.framesPerBuffer = framesPerBuffer
+        self.channels = channels
+        self.output = output if output is not None else PyAudioOutput()
+        self._voices: dict[int, Voice] = {}
+        self._ring: Optional[RingBuffer] = None
+        self._output: Optional[np.ndarray] = None
+        self._voiceMix: Optional[np.ndarray] = None
+        # First frame and time of the last audio callback
+        self._lastCallback = (0, 0.0)
+        self._outputLatency = 0.0
+        self._positions: Optional[PositionTable] = None
+        # Most frames asked by a callback
+        self._callbackFrames = 0
+        # Frame at which each timed command takes effect, frames to be read
+        # by the callback before measuring, time sent, description
+        self._timedCommands: deque[tuple[int, int, float, str]] = deque()
+        # Output health, updated by the audio callback
+        self._playing = False
+        self.underruns = 0
+        self.maxJitter = 0.0
+        self.health = HealthStats()
+
+    @classmethod
+    def fromSettings(cls, chunkSize: Optional[float] = None, framesPerBuffer: Optional[int] = None) -> 'MixerProcess':
+        # Sizes are given when calibrating them, for the configured output
+        if chunkSize is None:
+            chunkSize = settings.value(cls.CHUNK_SIZE_KEY, cls.CHUNK_SIZE_DEFAULT, type=float)
+        if framesPerBuffer is None:
+            framesPerBuffer = settings.value(cls.FRAMES_PER_BUFFER_KEY, cls.FRAMES_PER_BUFFER_DEFAULT, type=int)
+        return cls(
+            chunkSize,
+            framesPerBuffer,
+            settings.value(cls.CHANNELS_KEY, cls.CHANNELS, type=int),
+            createOutput(
+                settings.value(cls.OUTPUT_KEY, cls.OUTPUT_DEFAULT, type=str),
+                settings.value(cls.OUTPUT_FILE_KEY, '', type=str),
+                settings.value(cls.REAL_TIME_KEY, True, type=bool)
+            )
+        )
+
+    def chunkFrames(self) -> int:
+        return round(self.FRAME_RATE * self.chunkSize / 1000.0)
+
+    def mixerProcess(self, pipeIn: MessagePipe, pipeOut: MessagePipe, positionsPath: str, healthPath: str):
+        pipeIn.closeWriter()
+        pipeOut.closeReader()
+        positions = PositionTable.attach(positionsPath)
+        health = HealthStats.attach(healthPath)
+        try:
+            self.run(pipeIn, pipeOut, positions, health)
+        finally:
+            health.release()
+            positions.release()
+
+    def run(
+        self, pipeIn: MessagePipe, pipeOut: MessagePipe, positions: PositionTable, health: Optional[HealthStats] = None
+    ):
+        # Mixer loop, until quit or the GUI process is gone
+        self.pipeIn = pipeIn
+        self.pipeOut = pipeOut
+        self._positions = positions
+        if health is not None:
+            self.health = health
+        logger.debug(
+            f'Starting mixer process ({self.chunkSize:.1f} ms chunks, {self.framesPerBuffer} frames per buffer, '
+            f'{self.channels} channels, {type(self.output).__name__})'
+        )
+        self._openOutput()
+        try:
+            mix = np.zeros((self.chunkFrames(), self.channels), dtype=np.float32)
+            # Sleep until a command comes or there is room for a chunk
+            while self._readCommands(self._waitTime()):
+                self._fill(mix)
+                if not self.output.realTime:
+                    # Output plays what is queued at once, as fast as rendered
+                    self.output.advance(self._ring.available())
+                self._publishPositions()
+                self._reportLatencies()
+        finally:
+            self.output.close()
+
+    def calibrate(self, duration: float, voices: int = CALIBRATION_VOICES) -> tuple[int, float]:
+        # Run the mixer loop for duration seconds with voices cues playing,
+        # looped on a buffer of noise with gains and fades, so each chunk
+        # costs as much as during a show. Return the number of underruns
+        # and the largest callback jitter in ms, once the stream is settled.
+        self.pipeIn = MessagePipe()
+        self.pipeOut = MessagePipe(blockingWrite=False)
+        buffer = PcmBuffer.create(self.FRAME_RATE, 2, np.int16)
+        buffer.samples[:] = np.random.default_rng(0).integers(-10000, 10000, size=buffer.samples.shape, dtype=np.int16)
+        for cueId in range(voices):
+            voice = Voice(cueId, {'buffer': buffer.path}, self.pipeOut, self.chunkSize, channels=self.channels)
+            voice.execute(PlayerCommand('volume', Volume(-6.0, 0.0, -1.0)))
+            voice.execute(PlayerCommand('fade', Fade(0.25, 0.25)))
+            voice.execute(PlayerCommand('loop', -1))
+            voice.execute(PlayerCommand('play'))
+            self._voices[cueId] = voice
+        self._openOutput()
+        mix = np.zeros((self.chunkFrames(), self.channels), dtype=np.float32)
+        settled = time.monotonic() + self.CALIBRATION_SETTLING
+        end = settled + duration
+        try:
+            while (now := time.monotonic()) < end:
+                # Same work and waits as the mixer loop, without commands
+                self._fill(mix)
+                self._publishPositions()
+                self._reportLatencies()
+                self._readCommands(self._waitTime())
+                if now < settled:
+                    self.underruns = 0
+                    self.maxJitter = 0.0
+        finally:
+            self.output.close()
+            for voice in self._voices.values():
+                voice.release()
+            self._voices.clear()
+            buffer.release()
+        return self.underruns, self.maxJitter * 1000.0
+
+    def _openOutput(self) -> None:
+        self._ring = RingBuffer(self.RING_CHUNKS * self.chunkFrames(), self.channels)
+        self._output = np.zeros((self.chunkFrames(), self.channels), dtype=np.int16)
+        self._voiceMix = np.zeros((self.chunkFrames(), self.channels), dtype=np.float32)
+        self._callbackFrames = self.framesPerBuffer
+        self.output.open(self.FRAME_RATE, self.channels, self.framesPerBuffer, self._callback)
+        self._outputLatency = self.output.latency
+
+    def _callback(self, frameCount: int, underflow: bool = False) -> np.ndarray:
+        # Audio thread: copy mixed frames, silence when there is none
+        if underflow:
+            self.underruns += 1
+            self.health.count(HealthStats.DEVICE_UNDERRUNS)
+        if frameCount > len(self._output):
+            self._output = np.zeros((frameCount, self.channels), dtype=np.int16)
+        output = self._output[:frameCount]
+        self._callbackFrames = max(self._callbackFrames, frameCount)
+        first = self._ring.read
+        count = self._ring.readInto(output)
+        output[count:] = 0
+        now = self.output.clock()
+        if count < frameCount and self._playing:
+            self.underruns += 1
+            self.health.count(HealthStats.UNDERRUNS)
+        _, last = self._lastCallback
+        if last:
+            # Callbacks should come once per buffer duration
+            self.maxJitter = max(self.maxJitter, abs(now - last - frameCount / self.FRAME_RATE))
+        self._lastCallback = (first, now)
+        return output
+
+    def _fill(self, mix: np.ndarray) -> None:
+        while self._ring.free() >= len(mix):
+            start = time.perf_counter()
+            deadline = self._streamDeadline()
+            mix[:] = 0
+            written = 0
+            for voice in list(self._voices.values()):
+                if not voice.isPlaying():
+                    continue
+                # Rendered apart, kept by the voice to be taken back on stop
+                voiceMix = self._voiceMix[:len(mix)]
+                voiceMix[:] = 0
+                count = voice.render(voiceMix, deadline)
+                mix[:count] += voiceMix[:count]
+                voice.keep(self._ring.written, voiceMix[:count])
+                written = max(written, count)
+            if not written:
+                break
+            self._ring.write(toInt16(mix[:written]))
+            self.health.count(HealthStats.CHUNKS)
+            self.health.record(HealthStats.RENDER, round((time.perf_counter() - start) * 1e6))
+        self._playing = any(voice.isPlaying() for voice in self._voices.values())
+
+    def _streamDeadline(self) -> Optional[float]:
+        # Streamed cues wait for their decoder at most half the duration of
+        # the frames still queued, the other half is left to mix the chunk
+        # before the output runs dry. Without anything playing, at most one
+        # chunk, so that a GO from silence never holds the commands up.
+        # Outputs not in real time are never interrupted by waiting.
+        if not self.output.realTime:
+            return None
+        frames = self._ring.available() / 2 if self._playing else self.chunkFrames()
+        return time.monotonic() + frames / self.FRAME_RATE
+
+    def _publishPositions(self) -> None:
+        queued = self._ring.available()
+        heardAt = self.output.clock() + self._outputLatency
+        for voice in self._voices.values():
+            if voice.isPlaying():
+                voice.publish(queued, heardAt)
+
+    def _waitTime(self) -> Optional[float]:
+        if self._playing and not self.output.realTime:
+            # Output never waits for the mixer
+            return 0
+        if self._playing:
+            missing = self.chunkFrames() - self._ring.free()
+        elif self._timedCommands:
+            missing = self._timedCommands[0][1] - self._ring.read
+        else:
+            return None
+        return max(0.001, missing / self.FRAME_RATE)
+
+    def _reportLatencies(self) -> None:
+        first, callbackTime = self._lastCallback
+        while self._timedCommands and self._ring.read >= self._timedCommands[0][1]:
+            frame, _, sentAt, description = self._timedCommands.popleft()
+            # Output is continuous, so the frame is heard at a known offset of the callback
+            heardAt = callbackTime + (frame - first) / self.FRAME_RATE + self._outputLatency
+            logger.debug(f'{description} heard {max(0.0, heardAt - sentAt) * 1000.0:.1f} ms after sent')
+
+    def _readCommands(self, timeout: Optional[float]) -> bool:
+        received = 0
+        try:
+            msg = self.pipeIn.receive(timeout)
+            while msg is not None:
+                received += 1
+                if not self._execute(msg):
+                    return False
+                msg = self.pipeIn.receive(0)
+        except EOFError:
+            # GUI process is gone
+            return False
+        if received:
+            # Commands waiting when the mixer woke up
+            self.health.count(HealthStats.COMMANDS, received)
+            self.health.record(HealthStats.QUEUE, received)
+        return True
+
+    def _execute(self, msg: bytes) -> bool:
+        try:
+            cmd = PlayerCommand.fromBytes(msg)
+        except (InvalidMessage, InvalidCommand):
+            logger.error(f'Wrong message: "{msg}"')
+            return True
+        if cmd.sentAt is not None:
+            self.health.record(HealthStats.IPC, round((time.monotonic() - cmd.sentAt) * 1e6))
+        logger.debug(f'Receive message from main app.: "{cmd}"')
+        match cmd.command:
+            case 'quit':
+                return False
+            case 'register':
+                try:
+                    self._voices[cmd.cueId] = Voice(
+                        cmd.cueId, cmd.value, self.pipeOut, self.chunkSize, self._positions, self.channels
+                    )
+                except (DecoderError, OSError) as e:
+                    logger.error(f'Unable to open source of cue {cmd.cueId}: {e}')
+            case 'unregister':
+                voice = self._voices.pop(cmd.cueId, None)
+                if voice is not None:
+                    voice.release()
+            case _:
+                voice = self._voices.get(cmd.cueId)
+                if voice is None:
+                    pass
+                elif cmd.command == 'play' and not voice.isPlaying():
+                    self._timeCommand(cmd, voice, self._go(voice, cmd))
+                elif cmd.command in ('stop', 'pause') and voice.isPlaying():
+                    self._timeCommand(cmd, voice, self._cut(voice))
+                    voice.execute(cmd)
+                else:
+                    # Next rendered frame is the first one changed by the command
+                    self._timeCommand(cmd, voice, self._ring.written)
+                    voice.execute(cmd)
+        return True
+
+    def _go(self, voice: Voice, cmd: PlayerCommand) -> int:
+        # The first frames of the voice are added to the frames already
+        # queued, past the ones the callback may be reading, then the voice
+        # is rendered from the end of the queue as usual: pre-rolled frames
+        # of an armed voice, else frames rendered now (resume after pause).
+        # Return the first frame of the voice.
+        start = self._ring.read + (self._callbackFrames or self.chunkFrames())
+        queued = self._ring.written - start
+        preroll = voice.preroll(queued) if queued > 0 and voice.isArmed() else None
+        if preroll is not None:
+            voice.go(queued)
+        elif voice.isArmed():
+            voice.go(0)
+        else:
+            voice.execute(cmd)
+        if queued <= 0:
+            return self._ring.written
+        if preroll is None:
+            preroll = np.zeros((queued, self.channels), dtype=np.float32)
+            deadline = self._streamDeadline()
+            for offset in range(0, queued, self.chunkFrames()):
+                chunk = preroll[offset:offset + self.chunkFrames()]
+                if voice.render(chunk, deadline) < len(chunk):
+                    break
+        self._ring.add(start, preroll)
+        voice.keep(start, preroll)
+        return start
+
+    def _cut(self, voice: Voice) -> int:
+        # Reverse of GO: the frames of the voice are taken back from the
+        # frames queued, past the ones the callback may be reading, so that
+        # stop and pause are heard at the next device buffer. Return the
+        # first frame without the voice.
+        start = self._ring.read + (self._callbackFrames or self.chunkFrames())
+        start, samples = voice.takeBack(start, self._ring.written)
+        if samples is not None:
+            self._ring.add(start, -samples)
+        return start
+
+    def _timeCommand(self, cmd: PlayerCommand, voice: Voice, frame: int) -> None:
+        if cmd.command not in self.TIMED_COMMANDS or cmd.sentAt is None:
+            return
+        if cmd.command == 'play':
+            # Measured once the first frame of the cue is read
+            self._timedCommands.append((frame, frame + 1, cmd.sentAt, str(cmd)))
+        elif voice.isPlaying():
+            # Measured once the last frame before silence is read
+            self._timedCommands.append((frame, frame, cmd.sentAt, str(cmd)))
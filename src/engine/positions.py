@@ -0,0 +1,76 @@
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from engine.pcmbuffer import SHARED_DIRECTORY
+
+
+class PositionTable:
+    # Play position and state of each cue, written by the mixer process and
+    # read by the GUI at display rate, in a memory mapped file shared by both.
+    # A record is written between two increments of its sequence number, a
+    # reader retries while the number is odd or changes during the read.
+
+    DTYPE = np.dtype([('sequence', '<u8'), ('position', '<i8'), ('time', '<f8'), ('state', '<i8')])
+    # Reads of a record being written before giving up: a writer stopped
+    # in the middle of a write leaves the sequence number odd for ever
+    RETRIES = 1000
+
+    def __init__(self, path: str, records: np.ndarray, owner: bool) -> None:
+        self._path = path
+        self._records: Optional[np.ndarray] = records
+        self._owner = owner
+        # Last consistent value read from each slot
+        self._stable: dict[int, tuple[int, float, int]] = {}
+
+    @classmethod
+    def create(cls, capacity: int) -> 'PositionTable':
+        fd, path = tempfile.mkstemp(prefix='qsound-positions-', suffix='.npy', dir=SHARED_DIRECTORY)
+        os.close(fd)
+        records = np.lib.format.open_memmap(path, mode='w+', dtype=cls.DTYPE, shape=(capacity,))
+        return cls(path, records, owner=True)
+
+    @classmethod
+    def attach(cls, path: str) -> 'PositionTable':
+        return cls(path, np.load(path, mmap_mode='r+'), owner=False)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def capacity(self) -> int:
+        return len(self._records)
+
+    def write(self, slot: int, position: int, time: float, state: int) -> None:
+        # position is the frame heard at the given monotonic clock time
+        record = self._records[slot:slot + 1]
+        record['sequence'] += 1
+        record['position'] = position
+        record['time'] = time
+        record['state'] = state
+        record['sequence'] += 1
+
+    def read(self, slot: int) -> tuple[int, float, int]:
+        # Last value read from the slot when it stays inconsistent
+        record = self._records[slot:slot + 1]
+        for _ in range(self.RETRIES):
+            sequence = int(record['sequence'][0])
+            if sequence % 2 == 0:
+                position, time, state = int(record['position'][0]), float(record['time'][0]), int(record['state'][0])
+                if int(record['sequence'][0]) == sequence:
+                    self._stable[slot] = (position, time, state)
+                    return position, time, state
+        return self._stable.get(slot, (0, 0.0, 0))
+
+    def release(self) -> None:
+        if self._records is None:
+            return
+        self._records = None
+        if self._owner:
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class Resampler:
+    # Band limited resampling with a Hann windowed sinc kernel. Each output
+    # frame is the dot product of the input frames around it with one phase
+    # of the kernel, precomputed for the rate ratio; a whole block of output
+    # frames is computed at once by numpy. Blocks are independent of each
+    # other, so a file can be resampled from any position.
+
+    # Input frames on each side of an output frame, more when downsampling
+    HALF_TAPS = 16
+    # Phases of the kernel when the exact ratio needs more of them
+    MAX_PHASES = 1024
+
+    def __init__(self, inRate: int, outRate: int) -> None:
+        self.inRate = inRate
+        self.outRate = outRate
+        divisor = math.gcd(inRate, outRate)
+        # Output frame n is at input frame n * step / period
+        self._step = inRate // divisor
+        self._period = outRate // divisor
+        self._phases = min(self._period, self.MAX_PHASES)
+        # Kernel is stretched below the lowest Nyquist frequency against aliasing
+        cutoff = min(1.0, outRate / inRate)
+        self._halfTaps = math.ceil(self.HALF_TAPS / cutoff)
+        offsets = np.arange(1 - self._halfTaps, self._halfTaps + 1)
+        # One row per phase, last one is the next input frame
+        distances = offsets[np.newaxis, :] - (np.arange(self._phases + 1) / self._phases)[:, np.newaxis]
+        kernel = cutoff * np.sinc(cutoff * distances) * (0.5 + 0.5 * np.cos(np.pi * distances / self._halfTaps))
+        # Unity gain for every phase
+        kernel /= kernel.sum(axis=1, keepdims=True)
+        self._kernel = kernel.astype(np.float32)
+        self._offsets = offsets
+
+    def frames(self, inFrames: int) -> int:
+        return -(-inFrames * self._period // self._step)
+
+    def inputRange(self, position: int, count: int) -> tuple[int, int]:
+        # Input frames [first, last) used by output frames [position, position + count),
+        # first may be negative and last after the end of the input
+        first = position * self._step // self._period + int(self._offsets[0])
+        last = (position + count - 1) * self._step // self._period + int(self._offsets[-1]) + 1
+        return first, last
+
+    def resample(self, samples: np.ndarray, first: int, position: int, count: int) -> np.ndarray:
+        # samples are float (frames, channels) input frames from first,
+        # covering the input range of the output frames (zeros outside the file)
+        numerators = np.arange(position, position + count, dtype=np.int64) * self._step
+        bases = numerators // self._period
+        phases = ((numerators - bases * self._period) * self._phases + self._period // 2) // self._period
+        # Input frames of every output frame, gathered from a channel major
+        # copy: each window is contiguous, much faster than gathering frames
+        windows = sliding_window_view(np.ascontiguousarray(samples.T), len(self._offsets), axis=1)
+        windows = windows[:, bases - first + self._offsets[0]]
+        return np.einsum('ft,cft->fc', self._kernel[phases], windows)
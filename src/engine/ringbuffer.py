@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class RingBuffer:
+    # FIFO of audio frames over a preallocated array, for one producer (the
+    # mixer loop) and one consumer (the audio callback). Each side only moves
+    # its own counter, and a counter is moved after the copy, so no lock is
+    # needed between them.
+
+    def __init__(self, frames: int, channels: int, dtype: np.dtype = np.int16) -> None:
+        self._samples = np.zeros((frames, channels), dtype=dtype)
+        self._limits = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else np.finfo(dtype)
+        # Total number of frames written and read since creation
+        self._written = 0
+        self._read = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._samples)
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    @property
+    def read(self) -> int:
+        return self._read
+
+    def available(self) -> int:
+        return self._written - self._read
+
+    def free(self) -> int:
+        return self.capacity - self.available()
+
+    def write(self, samples: np.ndarray) -> int:
+        # Producer side, samples are converted to the buffer type on copy
+        count = min(len(samples), self.free())
+        start = self._written % self.capacity
+        first = min(count, self.capacity - start)
+        self._samples[start:start + first] = samples[:first]
+        self._samples[:count - first] = samples[first:count]
+        self._written += count
+        return count
+
+    def readInto(self, out: np.ndarray) -> int:
+        # Consumer side, return the number of frames copied into out
+        count = min(len(out), self.available())
+        start = self._read % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self._samples[start:start + first]
+        out[first:count] = self._samples[:count - first]
+        self._read += count
+        return count
+
+    def add(self, start: int, samples: np.ndarray) -> int:
+        # Producer side: mix samples into frames written but not read yet,
+        # from the absolute frame start. The caller keeps start past the
+        # frames the consumer may be reading.
+        count = max(0, min(len(samples), self._written - start))
+        begin = start % self.capacity
+        first = min(count, self.capacity - begin)
+        for part, added in (
+            (self._samples[begin:begin + first], samples[:first]),
+            (self._samples[:count - first], samples[first:count])
+        ):
+            part[:] = np.clip(part + added, self._limits.min, self._limits.max)
+        return count
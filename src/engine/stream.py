@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from engine.decoder import Decoder, DecoderError, openDecoder
+
+logger = logging.getLogger(__name__)
+
+
+class AudioStream:
+    # Plays a media file without decoding it entirely: a thread of the mixer
+    # process decodes blocks ahead of the play cursor, up to readAhead frames.
+    # Memory used does not depend on the file duration.
+    # Length and channels come from the loader, and the file is opened by
+    # the decoding thread, so the mixer never waits for the disk or ffprobe.
+    # Frames from the start point are kept decoded: going back to it (loop,
+    # stop, pre-roll) never waits for the decoder to seek.
+
+    # Longest wait of the mixer for missing frames when no deadline is given
+    TIMEOUT = 1.0
+
+    def __init__(self, filename: str, frameRate: int, readAhead: int, frames: int, channels: int) -> None:
+        self._filename = filename
+        self._frameRate = frameRate
+        self._decoder: Optional[Decoder] = None
+        self.frames = frames
+        self.channels = channels
+        self._readAhead = max(readAhead, Decoder.BLOCK_SIZE)
+        self._window = np.zeros((self._readAhead + 2 * Decoder.BLOCK_SIZE, self.channels), dtype=np.int16)
+        # Absolute position of the first frame of the window, and number of decoded frames in it
+        self._windowStart = 0
+        self._filled = 0
+        # First frames from the start point, as many as decoded ahead
+        self._head = np.zeros((min(self._readAhead, frames), self.channels), dtype=np.int16)
+        self._headStart = 0
+        self._headFilled = 0
+        self._cursor = 0
+        self._endOfFile = False
+        self._seekTo: Optional[int] = 0
+        self._generation = 0
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._decode, name=f'stream {filename}', daemon=True)
+        self._thread.start()
+
+    def read(self, position: int, count: int, deadline: Optional[float] = None) -> np.ndarray:
+        # Frames missing at deadline (time.monotonic) are played as silence
+        end = min(position + count, self.frames)
+        if end <= position:
+            return self._window[:0]
+        if deadline is None:
+            deadline = time.monotonic() + self.TIMEOUT
+        with self._condition:
+            headEnd = self._headStart + self._headFilled
+            if not self._headStart <= position < headEnd:
+                return self._readWindow(position, end, deadline)
+            head = self._head[position - self._headStart:min(end, headEnd) - self._headStart].copy()
+            if end <= headEnd:
+                # Decoder goes on after the start frames while they are played
+                self._cursor = position
+                if not self._reaches(headEnd):
+                    self._seek(headEnd)
+                self._condition.notify_all()
+                return head
+            return np.concatenate((head, self._readWindow(headEnd, end, deadline)))
+
+    def ready(self, position: int) -> int:
+        # Frames from position read without waiting
+        with self._condition:
+            headEnd = self._headStart + self._headFilled
+            if self._headStart <= position < headEnd:
+                return headEnd - position
+            if self._seekTo is None and self._windowStart <= position:
+                return max(0, self._windowStart + self._filled - position)
+            return 0
+
+    def setStart(self, position: int) -> None:
+        # Keep the frames from this start point, decoded before playing
+        with self._condition:
+            self._headStart = position
+            self._headFilled = 0
+            self._cursor = position
+            if self._seekTo is None:
+                self._keepHead(self._windowStart, self._window[:self._filled])
+            if not self._reaches(position):
+                self._seek(position)
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        if self._decoder is not None:
+            self._decoder.close()
+
+    def _readWindow(self, position: int, end: int, deadline: float) -> np.ndarray:
+        self._cursor = position
+        if not self._reaches(position):
+            self._seek(position)
+        self._condition.notify_all()
+        ready = self._condition.wait_for(
+            lambda: self._seekTo is None and (self._windowStart + self._filled >= end or self._endOfFile),
+            timeout=max(0.0, deadline - time.monotonic())
+        )
+        available = 0
+        if self._seekTo is None:
+            start = position - self._windowStart
+            available = max(0, min(end - self._windowStart, self._filled) - start)
+        if ready:
+            return self._window[start:start + available].copy()
+        # Decoder is late, fill with silence instead of blocking the mixer
+        logger.warning(f'Stream underrun at frame {position}')
+        samples = np.zeros((end - position, self.channels), dtype=np.int16)
+        if available:
+            samples[:available] = self._window[start:start + available]
+        return samples
+
+    def _reaches(self, position: int) -> bool:
+        # Whether the decoder gets to position by decoding forward: frames
+        # played as silence while it is late do not restart it each chunk
+        if self._seekTo is not None:
+            return self._seekTo <= position <= self._seekTo + self._readAhead
+        return self._windowStart <= position <= self._windowStart + self._filled + self._readAhead
+
+    def _seek(self, position: int) -> None:
+        self._seekTo = position
+        self._generation += 1
+
+    def _keepHead(self, position: int, block: np.ndarray) -> None:
+        # Copy the frames of a decoded block following the start frames
+        headEnd = self._headStart + self._headFilled
+        if not position <= headEnd < position + len(block):
+            return
+        frames = block[headEnd - position:headEnd - position + len(self._head) - self._headFilled]
+        self._head[self._headFilled:self._headFilled + len(frames)] = frames
+        self._headFilled += len(frames)
+
+    def _needsData(self) -> bool:
+        decodedAhead = self._windowStart + self._filled - self._cursor
+        return not self._endOfFile and decodedAhead < self._readAhead
+
+    def _fail(self, error: Exception) -> None:
+        logger.error(f'Unable to stream "{self._filename}": {error}')
+        with self._condition:
+            # Played as an empty file
+            self.frames = 0
+            self._seekTo = None
+            self._endOfFile = True
+            self._condition.notify_all()
+
+    def _decode(self) -> None:
+        try:
+            self._decoder = openDecoder(self._filename, self._frameRate, self.frames, self.channels)
+            self._decodeBlocks()
+        except (DecoderError, OSError) as e:
+            self._fail(e)
+
+    def _decodeBlocks(self) -> None:
+        while True:
+            seekTo = None
+            with self._condition:
+                self._condition.wait_for(lambda: not self._running or self._seekTo is not None or self._needsData())
+                if not self._running:
+                    break
+                if self._seekTo is not None:
+                    seekTo = self._seekTo
+                    self._windowStart = seekTo
+                    self._filled = 0
+                    self._endOfFile = False
+                    self._seekTo = None
+                # Forget frames already played when there is no room left
+                played = min(self._cursor - self._windowStart, self._filled)
+                if played > 0 and self._filled + Decoder.BLOCK_SIZE > len(self._window):
+                    self._window[:self._filled - played] = self._window[played:self._filled]
+                    self._windowStart += played
+                    self._filled -= played
+                count = min(Decoder.BLOCK_SIZE, len(self._window) - self._filled)
+                generation = self._generation
+            # Seek and decode without holding the lock, the mixer may read meanwhile
+            if seekTo is not None:
+                self._decoder.seek(seekTo)
+            block = self._decoder.read(count)
+            with self._condition:
+                if generation == self._generation:
+                    self._keepHead(self._windowStart + self._filled, block)
+                    self._window[self._filled:self._filled + len(block)] = block
+                    self._filled += len(block)
+                    self._endOfFile = len(block) < count
+                self._condition.notify_all()
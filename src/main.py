@@ -2,9 +2,7 @@ import sys
 import os
 import logging
 
-from PySide6.QtWidgets import QApplication
-
-from ui.mainwindow import MainWindow
+from startup import StartupTimer
 
 logger = logging.getLogger(__name__)
 
@@ -15,12 +13,33 @@ def main():
         logger.debug('Logging level set to DEBUG')
     else:
         logging.basicConfig(level=logging.ERROR)
+    # Heavy modules (audio engine, waveform chart, pydub) are imported once
+    # the window is shown, STARTUP_TIMING=true reports where time goes
+    timing = os.getenv('STARTUP_TIMING') in ('true', 'True')
+    timer = StartupTimer()
+    if timing:
+        timer.install()
+
+    from PySide6.QtCore import QTimer
+    from PySide6.QtWidgets import QApplication
+    timer.mark('Qt imports')
     app = QApplication(sys.argv)
-
+    timer.mark('QApplication')
+    from ui.mainwindow import MainWindow
+    timer.mark('Main window imports')
     mainWindow = MainWindow()
     mainWindow.readSettings()
     mainWindow.statusBar().showMessage(mainWindow.tr('Ready'))
+    timer.mark('Main window')
     mainWindow.show()
+    timer.mark('Show')
+    if timing:
+        def report():
+            # Cue editor and engine are started before, by the first event loop iteration
+            timer.mark('Cue editor, engine and first events')
+            timer.uninstall()
+            print(timer.report(), file=sys.stderr)
+        QTimer.singleShot(0, report)
     sys.exit(app.exec())
 
 
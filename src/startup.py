@@ -0,0 +1,50 @@
+import builtins
+import sys
+import time
+
+# Slowest imports shown in the report
+REPORTED_IMPORTS = 20
+
+
+class StartupTimer:
+    # Startup time of the application: time of each init phase and of the
+    # first import of each module, including the modules it imports itself.
+    # Enabled with STARTUP_TIMING=true, reported once the window is shown.
+
+    def __init__(self) -> None:
+        self._start = self._last = time.perf_counter()
+        self._phases: list[tuple[str, float]] = []
+        self._imports: dict[str, float] = {}
+        self._import = builtins.__import__
+
+    def install(self) -> None:
+        builtins.__import__ = self._timedImport
+
+    def uninstall(self) -> None:
+        builtins.__import__ = self._import
+
+    def mark(self, name: str) -> None:
+        # End of a phase, started at the end of the previous one
+        now = time.perf_counter()
+        self._phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        lines = [f'Startup: {(self._last - self._start) * 1000.0:.1f} ms']
+        for name, duration in self._phases:
+            lines.append(f'  {name:40} {duration * 1000.0:8.1f} ms')
+        lines.append('Slowest imports (including their own imports):')
+        imports = sorted(self._imports.items(), key=lambda item: item[1], reverse=True)
+        for name, duration in imports[:REPORTED_IMPORTS]:
+            lines.append(f'  {name:40} {duration * 1000.0:8.1f} ms')
+        return '\n'.join(lines)
+
+    def _timedImport(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Relative and already imported modules are not timed
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self._imports.setdefault(name, time.perf_counter() - start)
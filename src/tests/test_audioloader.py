@@ -0,0 +1,98 @@
+import time
+import wave
+from pathlib import Path
+
+import pytest
+from PySide6.QtCore import QCoreApplication, QEventLoop, QThread, QTimer
+
+from cue import audioloader
+from cue.audioloader import AudioLoader, LoadCancelled, loadAudio
+from engine.pcmcache import PcmCache
+
+SAMPLE = str(Path(__file__).parent / 'sample-1.wav')
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(PcmCache, '_instance', PcmCache(str(tmp_path / 'cache'), 1 << 20))
+
+
+class TestLoadAudio:
+    def test_progress(self, cache):
+        done = []
+        audio = loadAudio(SAMPLE, progress=lambda position, total: done.append((position, total)))
+        audio.buffer.release()
+        assert done == sorted(done)
+        assert done[-1] == (audio.frames, audio.frames)
+
+    def test_cancel(self, cache):
+        def cancel(position, total):
+            raise LoadCancelled()
+
+        with pytest.raises(LoadCancelled):
+            loadAudio(SAMPLE, progress=cancel)
+
+    def test_longConvertedFileIsStreamed(self, cache, tmp_path):
+        # Converted like a compressed file, but longer than the threshold:
+        # streamed instead of decoded into the cache first
+        filename = str(tmp_path / 'long.wav')
+        with wave.open(SAMPLE, 'rb') as source, wave.open(filename, 'wb') as wav:
+            wav.setnchannels(source.getnchannels())
+            wav.setsampwidth(2)
+            wav.setframerate(48000)
+            wav.writeframes(source.readframes(source.getnframes()))
+        audio = loadAudio(filename, streamingThreshold=1)
+        assert audio.buffer is None
+        assert audio.duration > 1.0
+        assert PcmCache.instance().size() == 0
+
+
+class TestAudioLoader:
+    def load(self, loader):
+        app = QCoreApplication.instance() or QCoreApplication([])
+        results = []
+        loop = QEventLoop(app)
+        loader.finished.connect(lambda audio: (results.append(audio), loop.quit()))
+        loader.failed.connect(lambda error: (results.append(error), loop.quit()))
+        QTimer.singleShot(5000, loop.quit)
+        loader.start()
+        loop.exec()
+        return results
+
+    def test_finished(self, cache):
+        percents = []
+        loader = AudioLoader(SAMPLE)
+        loader.progress.connect(percents.append)
+        results = self.load(loader)
+        assert len(results) == 1
+        results[0].buffer.release()
+        assert percents[-1] == 100
+
+    def test_failed(self, cache, tmp_path):
+        results = self.load(AudioLoader(str(tmp_path / 'missing.wav')))
+        assert len(results) == 1
+        assert isinstance(results[0], str)
+
+    def test_poolKeepsThreads(self, cache, monkeypatch):
+        # Pool threads are named on their first load, a new thread is not
+        names = []
+        load = audioloader.loadAudio
+
+        def countedLoad(*args):
+            thread = QThread.currentThread()
+            names.append(thread.objectName())
+            thread.setObjectName('used by a loader')
+            return load(*args)
+        monkeypatch.setattr(audioloader, 'loadAudio', countedLoad)
+        pool = AudioLoader.pool()
+        assert pool.expiryTimeout() == -1
+        for _ in range(2):
+            self.load(AudioLoader(SAMPLE))[0].buffer.release()
+            # Thread is idle once its loader returned
+            deadline = time.monotonic() + 1.0
+            while pool.activeThreadCount() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        # Second load is served by the thread started for the first one
+        assert names[0] != 'used by a loader'
+        assert names[1] == 'used by a loader'
+        assert AudioLoader.pool() is pool
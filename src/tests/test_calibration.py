@@ -0,0 +1,50 @@
+from engine import player
+from engine.calibration import CalibrationResult, measure
+from engine.health import HealthStats
+from engine.output import NullOutput, WavFileOutput
+from engine.player import MixerProcess
+
+
+class TestCalibrationResult:
+    def test_stable(self):
+        assert CalibrationResult(512, 0, 2.0).isStable()
+
+    def test_underrunsAreUnstable(self):
+        assert not CalibrationResult(512, 1, 0.0).isStable()
+
+    def test_jitterIsUnstable(self):
+        # 256 frames last 5.8 ms at 44100 Hz
+        assert not CalibrationResult(256, 0, 3.0).isStable()
+
+
+class TestCalibrate:
+    def test_rendersVoices(self):
+        mixer = MixerProcess(1024 * 1000.0 / MixerProcess.FRAME_RATE, 1024, output=NullOutput())
+        mixer.calibrate(0.2, voices=4)
+        # Chunks are rendered by the mixer loop, from the playing voices
+        assert mixer.health.counter(HealthStats.CHUNKS) > 0
+        assert mixer.health.maximum(HealthStats.RENDER) > 0
+        assert not mixer._voices
+
+    def test_configuredOutput(self, tmp_path, monkeypatch):
+        values = {
+            MixerProcess.CHANNELS_KEY: 4,
+            MixerProcess.OUTPUT_KEY: 'wav',
+            MixerProcess.OUTPUT_FILE_KEY: str(tmp_path / 'out.wav'),
+        }
+
+        class Settings:
+            def value(self, key, default=None, type=None):
+                return values.get(key, default)
+
+        mixers = []
+
+        def calibrate(mixer, duration, voices):
+            mixers.append(mixer)
+            return 0, 0.0
+        monkeypatch.setattr(player, 'settings', Settings())
+        monkeypatch.setattr(MixerProcess, 'calibrate', calibrate)
+        assert measure(256, 0.1).isStable()
+        # Sizes measured on the output and channels the engine plays with
+        assert (mixers[0].chunkFrames(), mixers[0].framesPerBuffer, mixers[0].channels) == (256, 256, 4)
+        assert isinstance(mixers[0].output, WavFileOutput)
@@ -0,0 +1,166 @@
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from engine.decoder import ConvertingWavDecoder, Decoder, FfmpegDecoder, WavDecoder, openDecoder
+from engine.stream import AudioStream
+
+SAMPLE = str(Path(__file__).parent / 'sample-1.wav')
+
+
+def wavSamples() -> np.ndarray:
+    with wave.open(SAMPLE, 'rb') as wav:
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').reshape(-1, wav.getnchannels())
+
+
+class TestDecoder:
+    def test_openWavDecoder(self):
+        decoder = openDecoder(SAMPLE, 44100)
+        assert isinstance(decoder, WavDecoder)
+        assert decoder.frames == len(wavSamples())
+        decoder.close()
+
+    def test_blocks(self):
+        decoder = openDecoder(SAMPLE, 44100)
+        blocks = list(decoder.blocks())
+        decoder.close()
+        assert all(len(block) <= Decoder.BLOCK_SIZE for _, block in blocks)
+        assert blocks[1][0] == len(blocks[0][1])
+        assert np.array_equal(np.concatenate([block for _, block in blocks]), wavSamples())
+
+    def test_seek(self):
+        decoder = openDecoder(SAMPLE, 44100)
+        decoder.seek(1000)
+        assert np.array_equal(decoder.read(10), wavSamples()[1000:1010])
+        decoder.close()
+
+    def test_notInMixerFormat(self):
+        assert not WavDecoder.canRead(SAMPLE, 48000)
+
+    def test_knownLengthIsNotProbed(self, monkeypatch):
+        def mediainfo(filename):
+            raise AssertionError('ffprobe run')
+        monkeypatch.setattr('pydub.utils.mediainfo', mediainfo)
+        decoder = FfmpegDecoder(str(Path(__file__).parent / 'sample-2.mp3'), 44100, 1000, 2)
+        assert (decoder.frames, decoder.channels) == (1000, 2)
+
+
+def writeWav(path, frameRate: int, sampleWidth: int, samples: np.ndarray, channels: int = 0) -> str:
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(channels or samples.shape[1])
+        wav.setsampwidth(sampleWidth)
+        wav.setframerate(frameRate)
+        wav.writeframes(samples.tobytes())
+    return str(path)
+
+
+class TestConvertingWavDecoder:
+    def test_otherFrameRate(self, tmp_path):
+        filename = writeWav(tmp_path / 'sample.wav', 48000, 2, wavSamples()[:48000])
+        decoder = openDecoder(filename, 44100)
+        assert isinstance(decoder, ConvertingWavDecoder)
+        assert decoder.frames == 44100
+        samples = np.concatenate([block for _, block in decoder.blocks()])
+        decoder.close()
+        assert samples.shape == (44100, 2)
+
+    def test_24BitsMono(self, tmp_path):
+        values = np.array([0, 1 << 22, -(1 << 22), (1 << 23) - 1], dtype=np.int32)
+        data = np.stack([values & 255, (values >> 8) & 255, (values >> 16) & 255], axis=1).astype(np.uint8)
+        filename = writeWav(tmp_path / 'sample.wav', 44100, 3, data, channels=1)
+        decoder = openDecoder(filename, 44100)
+        samples = decoder.read(10)
+        decoder.close()
+        assert samples.tolist() == [[0], [16384], [-16384], [32767]]
+
+    def test_8Bits(self, tmp_path):
+        filename = writeWav(tmp_path / 'sample.wav', 44100, 1, np.array([[128, 255], [0, 192]], dtype=np.uint8))
+        decoder = openDecoder(filename, 44100)
+        samples = decoder.read(10)
+        decoder.close()
+        assert samples.tolist() == [[0, 32512], [-32768, 16384]]
+
+    def test_seek(self, tmp_path):
+        filename = writeWav(tmp_path / 'sample.wav', 22050, 2, wavSamples()[:22050])
+        decoder = openDecoder(filename, 44100)
+        whole = decoder.read(44100)
+        decoder.seek(10000)
+        assert np.array_equal(decoder.read(100), whole[10000:10100])
+        decoder.close()
+
+
+def openStream(readAhead: int) -> AudioStream:
+    with wave.open(SAMPLE, 'rb') as wav:
+        return AudioStream(SAMPLE, 44100, readAhead, wav.getnframes(), wav.getnchannels())
+
+
+def waitReady(stream: AudioStream, position: int, frames: int) -> None:
+    end = time.monotonic() + 5.0
+    while stream.ready(position) < frames:
+        assert time.monotonic() < end
+        time.sleep(0.01)
+
+
+class TestAudioStream:
+    def test_sequentialRead(self):
+        expected = wavSamples()
+        stream = openStream(Decoder.BLOCK_SIZE)
+        assert stream.frames == len(expected)
+        position = 0
+        chunks = []
+        while True:
+            chunk = stream.read(position, 4410)
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+            position += len(chunk)
+        stream.release()
+        assert np.array_equal(np.concatenate(chunks), expected)
+
+    def test_seekBackward(self):
+        expected = wavSamples()
+        stream = openStream(Decoder.BLOCK_SIZE)
+        assert np.array_equal(stream.read(100000, 100), expected[100000:100100])
+        assert np.array_equal(stream.read(10, 100), expected[10:110])
+        stream.release()
+
+    def test_readAfterEnd(self):
+        stream = openStream(Decoder.BLOCK_SIZE)
+        assert len(stream.read(stream.frames, 100)) == 0
+        assert len(stream.read(stream.frames - 10, 100)) == 10
+        stream.release()
+
+    def test_startFramesAreKept(self):
+        expected = wavSamples()
+        stream = openStream(Decoder.BLOCK_SIZE)
+        stream.setStart(1000)
+        waitReady(stream, 1000, Decoder.BLOCK_SIZE)
+        assert np.array_equal(stream.read(100000, 100), expected[100000:100100])
+        # Back to the start point without waiting for the decoder to seek
+        start = stream.read(1000, 4410, deadline=time.monotonic())
+        stream.release()
+        assert np.array_equal(start, expected[1000:5410])
+
+    def test_lateDecoderPlaysSilence(self):
+        stream = openStream(Decoder.BLOCK_SIZE)
+        samples = stream.read(100000, 100, deadline=time.monotonic())
+        stream.release()
+        assert samples.shape == (100, 2)
+        assert not samples.any()
+
+    def test_playsOnAfterStartFrames(self):
+        expected = wavSamples()
+        stream = openStream(Decoder.BLOCK_SIZE)
+        waitReady(stream, 0, Decoder.BLOCK_SIZE)
+        stream.read(100000, 100)
+        # Start frames then the frames decoded after them, in the same read
+        samples = stream.read(Decoder.BLOCK_SIZE - 100, 200)
+        stream.release()
+        assert np.array_equal(samples, expected[Decoder.BLOCK_SIZE - 100:Decoder.BLOCK_SIZE + 100])
+
+    def test_missingFileIsEmpty(self, tmp_path):
+        stream = AudioStream(str(tmp_path / 'missing.wav'), 44100, Decoder.BLOCK_SIZE, 1000, 2)
+        assert len(stream.read(0, 100)) == 0
+        stream.release()
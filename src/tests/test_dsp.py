@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from cue.fade import Fade
+from cue.volume import Volume
+from engine.dsp import GainStage, dbToGain, defaultRouting, fadeEnvelope, mixInto, outputGains, toInt16
+
+
+class TestDsp:
+    def test_dbToGain(self):
+        assert dbToGain(0.0) == 1.0
+        assert dbToGain(20.0) == pytest.approx(10.0)
+        assert dbToGain(-6.0) == pytest.approx(0.501, abs=1e-3)
+
+    def test_dbToGainMinIsSilence(self):
+        assert dbToGain(Volume.MIN) == 0.0
+
+    def test_outputGains(self):
+        gains = outputGains(Volume(-6.0, 0.0, Volume.MIN), 3)
+        assert gains[0] == pytest.approx(dbToGain(-6.0))
+        assert gains[1] == 0.0
+        # Outputs beyond left and right only follow the master volume
+        assert gains[2] == pytest.approx(dbToGain(-6.0))
+
+    def test_mixIntoShorterChunk(self):
+        mix = np.zeros((4, 2), dtype=np.float32)
+        samples = np.full((2, 2), 100, dtype=np.int16)
+        mixInto(mix, samples, np.ones((4, 2), dtype=np.float32))
+        assert mix.tolist() == [[100, 100], [100, 100], [0, 0], [0, 0]]
+
+    def test_sameResultAsPydub(self):
+        rng = np.random.default_rng(0)
+        samples = rng.integers(-10000, 10000, size=(441, 2), dtype=np.int16)
+        audio = AudioSegment(samples.tobytes(), frame_rate=44100, sample_width=2, channels=2)
+        left, right = audio.split_to_mono()
+        expected = (AudioSegment.from_mono_audiosegments(left + 2.0, right - 3.0) - 4.0).get_array_of_samples()
+        mix = np.zeros(samples.shape, dtype=np.float32)
+        GainStage(defaultRouting(2, 2), Volume(-4.0, 2.0, -3.0), len(samples)).mixInto(mix, samples)
+        result = np.frombuffer(toInt16(mix), dtype=np.int16)
+        assert np.abs(result.astype(np.int32) - np.array(expected)).max() <= 2
+
+    def test_toInt16Clips(self):
+        mix = np.array([[40000.0, -40000.0]], dtype=np.float32)
+        assert np.frombuffer(toInt16(mix), dtype=np.int16).tolist() == [32767, -32768]
+
+    def test_fadeEnvelopeOutsideFades(self):
+        assert fadeEnvelope(0, 10, 0, 100, Fade(), 10) is None
+        assert fadeEnvelope(30, 10, 0, 100, Fade(2.0, 2.0), 10) is None
+
+    def test_fadeEnvelopeFadeIn(self):
+        envelope = fadeEnvelope(10, 4, 10, 100, Fade(0.4, 0.0), 10)
+        assert envelope == pytest.approx([0.0, 0.25, 0.5, 0.75])
+
+    def test_fadeEnvelopeFadeOut(self):
+        envelope = fadeEnvelope(96, 4, 0, 100, Fade(0.0, 0.4), 10)
+        assert envelope == pytest.approx([1.0, 0.75, 0.5, 0.25])
+
+    def test_fadeEnvelopeBothFades(self):
+        envelope = fadeEnvelope(0, 4, 0, 4, Fade(0.4, 0.4), 10)
+        assert envelope == pytest.approx([0.0, 0.25, 0.5, 0.25])
+
+    def test_fadeEnvelopeOfLongFile(self):
+        # Past 2^24 frames, float32 positions cannot tell frames apart
+        starts = 1 << 25
+        envelope = fadeEnvelope(starts + 1, 4, starts, starts + 1000, Fade(0.4, 0.0), 10)
+        assert envelope == pytest.approx([0.25, 0.5, 0.75, 1.0])
+        assert envelope.dtype == np.float32
+
+    def test_mixIntoWithEnvelope(self):
+        mix = np.zeros((2, 2), dtype=np.float32)
+        samples = np.full((2, 2), 100, dtype=np.int16)
+        mixInto(mix, samples, np.ones((2, 2), dtype=np.float32), np.array([0.5, 1.0], dtype=np.float32))
+        assert mix.tolist() == [[50, 50], [100, 100]]
+
+    def test_defaultRouting(self):
+        assert defaultRouting(1, 2).tolist() == [[1.0, 1.0]]
+        assert defaultRouting(2, 2).tolist() == [[1.0, 0.0], [0.0, 1.0]]
+        assert defaultRouting(2, 1).tolist() == [[0.5], [0.5]]
+        assert defaultRouting(2, 4).tolist() == [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]]
+        # 5.1 centre on both sides, LFE dropped
+        assert defaultRouting(6, 2)[2:4].ravel() == pytest.approx([0.707, 0.707, 0.0, 0.0])
+
+    def test_gainStageSameAsMatrixProduct(self):
+        samples = np.random.default_rng(0).integers(-10000, 10000, size=(441, 2), dtype=np.int16)
+        stage = GainStage(defaultRouting(2, 2), Volume(-4.0, 2.0, -3.0), len(samples))
+        mix = np.zeros(samples.shape, dtype=np.float32)
+        stage.mixInto(mix, samples)
+        assert mix == pytest.approx(samples @ stage.matrix)
+
+    def test_gainStageMatrix(self):
+        samples = np.array([[100, 10, 1]] * 2, dtype=np.int16)
+        routing = np.array([[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]], dtype=np.float32)
+        mix = np.zeros((2, 2), dtype=np.float32)
+        GainStage(routing, Volume(), 2).mixInto(mix, samples, np.array([1.0, 0.5], dtype=np.float32))
+        assert mix.tolist() == [[100.5, 10.5], [50.25, 5.25]]
@@ -0,0 +1,129 @@
+import os
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from cue.volume import Volume
+from engine.output import NullOutput
+from engine.pcmbuffer import PcmBuffer
+from engine.player import Engine, MixerProcess, Player, PlayerCommand, PlayerStates
+
+
+def hang(*args):
+    # Mixer process which never reads its messages
+    time.sleep(60)
+
+
+def talk(messages, pipeIn, pipeOut, positionsPath, healthPath):
+    # Mixer process which sends messages, then stays until told to quit
+    # when wait is in the messages, else exits at once
+    for message in messages:
+        if message == b'wait':
+            while (received := pipeIn.receive(5.0)) is not None:
+                if PlayerCommand.fromBytes(received).command == 'quit':
+                    break
+        else:
+            pipeOut.send(message)
+
+
+def waitFor(condition) -> None:
+    # Run the event loop until condition is true
+    end = time.monotonic() + 5.0
+    while not condition():
+        assert time.monotonic() < end
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+
+
+def fillPipe(engine: Engine) -> None:
+    # Messages the mixer never reads, as from a fader drag, until the
+    # pipe has no room left for any message
+    writer = engine._pipeToProcess._writer.fileno()
+    os.set_blocking(writer, False)
+    for message in (PlayerCommand('volume', Volume(-3.0, 0.0, 0.0), 0).toBytes(), b''):
+        while engine._pipeToProcess.send(message):
+            pass
+    os.set_blocking(writer, True)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    QCoreApplication.instance() or QCoreApplication([])
+    monkeypatch.setattr(MixerProcess, 'fromSettings', classmethod(lambda cls: cls(output=NullOutput())))
+    monkeypatch.setattr(Engine, 'QUIT_TIMEOUT', 0.5)
+    return Engine()
+
+
+class TestEngine:
+    def test_quit(self, engine):
+        engine.start()
+        process = engine._process
+        start = time.monotonic()
+        engine.quit()
+        assert time.monotonic() - start < Engine.QUIT_TIMEOUT
+        assert process.exitcode == 0
+        assert not engine.isRunning()
+        # Cues released after the engine send nothing
+        engine.unregister(0)
+
+    def test_hungMixerIsTerminated(self, engine):
+        engine._mixer.mixerProcess = hang
+        engine.start()
+        process = engine._process
+        fillPipe(engine)
+        start = time.monotonic()
+        engine.quit()
+        # Quit message is dropped after a timeout, then the process is terminated
+        assert time.monotonic() - start < 3 * Engine.QUIT_TIMEOUT
+        assert process.exitcode is not None and process.exitcode < 0
+
+    def test_sendToHungMixerDoesNotBlock(self, engine, caplog):
+        engine._mixer.mixerProcess = hang
+        engine.start()
+        fillPipe(engine)
+        start = time.monotonic()
+        engine.send(PlayerCommand('stop', cueId=0))
+        assert time.monotonic() - start < 10 * Engine.SEND_TIMEOUT
+        assert '"stop" dropped' in caplog.text
+        engine.quit()
+
+    def startTalking(self, engine, monkeypatch, *messages: bytes) -> tuple[Player, list]:
+        monkeypatch.setattr(Engine, '_instance', engine)
+        engine._mixer.mixerProcess = partial(talk, messages)
+        engine.start()
+        buffer = PcmBuffer.create(100, 2, np.int16)
+        player = Player(buffer)
+        states = []
+        player.changedState.connect(states.append)
+        return player, states
+
+    def test_stateIsDispatched(self, engine, monkeypatch, caplog):
+        player, states = self.startTalking(
+            engine, monkeypatch,
+            b'not a command',
+            PlayerCommand('state', PlayerStates.Playing, 0).toBytes(),
+            # Unknown cue, already removed
+            PlayerCommand('state', PlayerStates.Stopped, 7).toBytes(),
+            b'wait'
+        )
+        waitFor(lambda: states)
+        # Wrong messages are skipped, the next ones still reach their player
+        assert states == [PlayerStates.Playing]
+        assert 'Wrong message' in caplog.text
+        assert engine._positionTimer.isActive()
+        player.quit()
+        engine.quit()
+
+    def test_mixerStopped(self, engine, monkeypatch, caplog):
+        player, states = self.startTalking(engine, monkeypatch, PlayerCommand('state', PlayerStates.Playing, 0).toBytes())
+        waitFor(lambda: 'stopped unexpectedly' in caplog.text)
+        assert states == [PlayerStates.Playing]
+        # Nothing is read from the dead mixer any more
+        assert not engine._notifier.isEnabled()
+        assert not engine._positionTimer.isActive()
+        assert not engine._playing
+        player.quit()
+        engine.quit()
@@ -0,0 +1,38 @@
+import json
+
+from engine.health import HealthStats
+
+
+class TestHealthStats:
+    def test_buckets(self):
+        health = HealthStats()
+        for value in (0, 1, 3, 3, 100, 5000):
+            health.record(HealthStats.RENDER, value)
+        summary = health.summary()['histograms']['render']
+        assert summary['buckets'][:3] == [1, 1, 2]
+        assert summary['buckets'][7] == 1
+        assert summary['max'] == 5000
+        assert health.percentile(HealthStats.RENDER, 0.5) == 4
+        # Bounded by the largest value
+        assert health.percentile(HealthStats.RENDER, 1.0) == 5000
+        assert health.percentile(HealthStats.IPC, 0.5) == 0
+
+    def test_largeValuesInLastBucket(self):
+        health = HealthStats()
+        health.record(HealthStats.IPC, 1 << 40)
+        assert health.summary()['histograms']['ipc']['buckets'][-1] == 1
+
+    def test_shared(self, tmp_path):
+        health = HealthStats.create()
+        mixer = HealthStats.attach(health.path)
+        mixer.count(HealthStats.UNDERRUNS)
+        mixer.count(HealthStats.COMMANDS, 3)
+        mixer.record(HealthStats.QUEUE, 3)
+        assert health.counter(HealthStats.UNDERRUNS) == 1
+        assert health.counter(HealthStats.COMMANDS) == 3
+        assert health.maximum(HealthStats.QUEUE) == 3
+        filename = tmp_path / 'health.json'
+        health.dump(str(filename))
+        assert json.loads(filename.read_text())['counters']['commands'] == 3
+        mixer.release()
+        health.release()
@@ -0,0 +1,151 @@
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from cue.fade import Fade
+from engine.health import HealthStats
+from engine.ipc import MessagePipe
+from engine.output import NullOutput, WavFileOutput
+from engine.pcmbuffer import PcmBuffer
+from engine.player import MixerProcess, PlayerCommand, PlayerStates
+from engine.positions import PositionTable
+
+
+@pytest.fixture
+def ramp():
+    buffer = PcmBuffer.create(1000, 2, np.int16)
+    buffer.samples[:] = np.arange(1000)[:, np.newaxis]
+    yield buffer
+    buffer.release()
+
+
+def play(output: NullOutput, buffer: PcmBuffer, *commands: PlayerCommand) -> MixerProcess:
+    # Runs the mixer loop in a thread until the cue is stopped
+    pipeIn = MessagePipe()
+    pipeOut = MessagePipe(blockingWrite=False)
+    positions = PositionTable.create(4)
+    mixer = MixerProcess(10.0, 441, output=output)
+    thread = threading.Thread(target=mixer.run, args=(pipeIn, pipeOut, positions))
+    thread.start()
+    try:
+        pipeIn.send(PlayerCommand('register', {'buffer': buffer.path, 'slot': 0}, 0).toBytes())
+        for command in commands:
+            pipeIn.send(command.toBytes())
+        pipeIn.send(PlayerCommand('play', cueId=0).toBytes())
+        # Stopped once registered, then playing until the end
+        states = []
+        while states[-2:] != [PlayerStates.Playing, PlayerStates.Stopped]:
+            msg = pipeOut.receive(5.0)
+            assert msg is not None
+            states.append(PlayerCommand.fromBytes(msg).value)
+    finally:
+        pipeIn.send(PlayerCommand('quit').toBytes())
+        thread.join()
+        positions.release()
+    return mixer
+
+
+class TestNullOutput:
+    def test_loopIsCaptured(self, ramp):
+        output = NullOutput(realTime=False, capture=True)
+        mixer = play(output, ramp, PlayerCommand('loop', 1, 0))
+        samples = output.samples()
+        # 2000 frames in chunks of 441
+        assert mixer.health.counter(HealthStats.CHUNKS) == 5
+        assert mixer.health.counter(HealthStats.COMMANDS) >= 3
+        assert np.array_equal(samples[:2000, 0], np.tile(np.arange(1000), 2))
+        assert not samples[2000:].any()
+        # Clock is the duration played, not the wall clock
+        assert output.clock() - output._start == pytest.approx(len(samples) / MixerProcess.FRAME_RATE)
+
+    def test_fadeIn(self, ramp):
+        output = NullOutput(realTime=False, capture=True)
+        play(output, ramp, PlayerCommand('fade', Fade(500 / MixerProcess.FRAME_RATE, 0.0), 0))
+        samples = output.samples()[:1000, 0]
+        assert samples[0] == 0
+        assert np.all(samples[:500] <= np.arange(500))
+        assert np.array_equal(samples[500:], np.arange(500, 1000))
+
+    def test_realTime(self):
+        output = NullOutput(realTime=True)
+        output.open(MixerProcess.FRAME_RATE, 2, 441, lambda count, underflow: np.zeros((count, 2), dtype=np.int16))
+        time.sleep(0.2)
+        output.close()
+        # Buffers of 10 ms are played as time goes by
+        assert 10 <= output.frames / 441 <= 25
+
+    def test_deviceUnderflowIsCounted(self):
+        mixer = MixerProcess(10.0, 441, output=NullOutput(realTime=False))
+        mixer._openOutput()
+        mixer._callback(441, False)
+        mixer._callback(441, True)
+        # Counted apart from the ring buffer underruns, both make calibration fail
+        assert mixer.health.counter(HealthStats.DEVICE_UNDERRUNS) == 1
+        assert mixer.health.counter(HealthStats.UNDERRUNS) == 0
+        assert mixer.underruns == 1
+
+    def test_streamWaitFromSilence(self):
+        # GO of a streamed cue from silence waits at most one chunk for the decoder
+        mixer = MixerProcess(10.0, 441, output=NullOutput(realTime=True))
+        mixer._openOutput()
+        deadline = mixer._streamDeadline()
+        mixer.output.close()
+        assert deadline is not None
+        assert deadline - time.monotonic() <= mixer.chunkSize / 1000.0
+        assert MixerProcess(output=NullOutput(realTime=False))._streamDeadline() is None
+
+
+class TestWavFileOutput:
+    def test_writesFrames(self, tmp_path, ramp):
+        filename = str(tmp_path / 'out.wav')
+        output = WavFileOutput(filename)
+        play(output, ramp)
+        with wave.open(filename, 'rb') as wav:
+            assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (2, 2, MixerProcess.FRAME_RATE)
+            assert wav.getnframes() == output.frames
+            samples = np.frombuffer(wav.readframes(1000), dtype='<i2').reshape(-1, 2)
+        assert np.array_equal(samples[:, 0], np.arange(1000))
+
+
+class TestStopLatency:
+    # Mixer driven by hand: chunks of 441 frames, callbacks of 64
+    def mixer(self, buffer: PcmBuffer) -> MixerProcess:
+        mixer = MixerProcess(10.0, 64, output=NullOutput(realTime=False))
+        mixer.pipeOut = MessagePipe(blockingWrite=False)
+        mixer._openOutput()
+        mixer._execute(PlayerCommand('register', {'buffer': buffer.path}, 0).toBytes())
+        mixer._execute(PlayerCommand('play', cueId=0).toBytes())
+        return mixer
+
+    def heard(self, mixer: MixerProcess, callbacks: int) -> np.ndarray:
+        mix = np.zeros((mixer.chunkFrames(), mixer.channels), dtype=np.float32)
+        frames = []
+        for _ in range(callbacks):
+            mixer._fill(mix)
+            frames.append(mixer._callback(64)[:, 0].copy())
+        return np.concatenate(frames)
+
+    def test_stopIsHeardAtNextBuffer(self, ramp):
+        mixer = self.mixer(ramp)
+        before = self.heard(mixer, 3)
+        mixer._execute(PlayerCommand('stop', cueId=0).toBytes())
+        after = self.heard(mixer, 4)
+        # Only the buffer the callback may be reading is still played
+        assert np.array_equal(before, np.arange(192))
+        assert np.array_equal(after[:64], np.arange(192, 256))
+        assert not after[64:].any()
+
+    def test_pauseResumesWithoutSkipping(self, ramp):
+        mixer = self.mixer(ramp)
+        before = self.heard(mixer, 3)
+        mixer._execute(PlayerCommand('pause', cueId=0).toBytes())
+        paused = self.heard(mixer, 2)
+        mixer._execute(PlayerCommand('play', cueId=0).toBytes())
+        after = self.heard(mixer, 4)
+        # Resumed at the next buffer too, where the pause stopped
+        assert not paused[64:].any()
+        assert np.array_equal(after[:64], np.zeros(64))
+        assert np.array_equal(np.concatenate((before, paused[:64], after[64:])), np.arange(448))
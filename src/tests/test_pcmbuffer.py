@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+from engine.pcmbuffer import PcmBuffer
+
+
+class TestPcmBuffer:
+    def test_createAndAttach(self):
+        buffer = PcmBuffer.create(100, 2, np.int16)
+        buffer.samples[:] = np.arange(200, dtype=np.int16).reshape(-1, 2)
+        view = PcmBuffer.attach(buffer.path)
+        assert view.samples.shape == (100, 2)
+        assert np.array_equal(view.samples, buffer.samples)
+        view.release()
+        buffer.release()
+
+    def test_attachedBufferSeesChanges(self):
+        buffer = PcmBuffer.create(10, 1, np.int16)
+        view = PcmBuffer.attach(buffer.path)
+        buffer.samples[3] = 42
+        assert view.samples[3, 0] == 42
+        view.release()
+        buffer.release()
+
+    def test_releaseRemovesFile(self):
+        buffer = PcmBuffer.create(10, 2, np.int16)
+        path = buffer.path
+        assert os.path.exists(path)
+        buffer.release()
+        assert not os.path.exists(path)
+        assert buffer.samples is None
+
+    def test_releaseAttachedKeepsFile(self):
+        buffer = PcmBuffer.create(10, 2, np.int16)
+        view = PcmBuffer.attach(buffer.path)
+        view.release()
+        assert os.path.exists(buffer.path)
+        buffer.release()
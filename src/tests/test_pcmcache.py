@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from engine.pcmcache import PcmCache
+
+
+class TestPcmCache:
+    def mediaFile(self, tmp_path, name='media.mp3', content=b'compressed audio'):
+        path = tmp_path / name
+        path.write_bytes(content)
+        return str(path)
+
+    def storeSamples(self, cache, filename, frames=100):
+        buffer = cache.create(filename, 44100, 2, frames, np.int16)
+        buffer.samples[:] = 7
+        return cache.store(buffer)
+
+    def test_missThenHit(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1 << 20)
+        filename = self.mediaFile(tmp_path)
+        assert cache.load(filename, 44100, 2) is None
+        self.storeSamples(cache, filename).release()
+        buffer = cache.load(filename, 44100, 2)
+        assert buffer.samples.shape == (100, 2)
+        assert np.all(buffer.samples == 7)
+        buffer.release()
+
+    def test_keyDependsOnFormat(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1 << 20)
+        filename = self.mediaFile(tmp_path)
+        self.storeSamples(cache, filename).release()
+        assert cache.load(filename, 48000, 2) is None
+
+    def test_changedFileIsMissed(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1 << 20)
+        filename = self.mediaFile(tmp_path)
+        self.storeSamples(cache, filename).release()
+        self.mediaFile(tmp_path, content=b'other compressed audio')
+        assert cache.load(filename, 44100, 2) is None
+
+    def test_sameContentIsShared(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1 << 20)
+        self.storeSamples(cache, self.mediaFile(tmp_path)).release()
+        copy = self.mediaFile(tmp_path, name='copy.mp3')
+        assert cache.load(copy, 44100, 2) is not None
+
+    def test_indexIsPersistent(self, tmp_path):
+        filename = self.mediaFile(tmp_path)
+        self.storeSamples(PcmCache(str(tmp_path / 'cache'), 1 << 20), filename).release()
+        assert PcmCache(str(tmp_path / 'cache'), 1 << 20).load(filename, 44100, 2) is not None
+
+    def test_evictLeastRecentlyUsed(self, tmp_path):
+        # Each stored file is 40000 bytes of samples and a small header
+        cache = PcmCache(str(tmp_path / 'cache'), 100000)
+        first = self.mediaFile(tmp_path, name='1.mp3', content=b'1')
+        second = self.mediaFile(tmp_path, name='2.mp3', content=b'2')
+        third = self.mediaFile(tmp_path, name='3.mp3', content=b'3')
+        self.storeSamples(cache, first, 10000).release()
+        self.storeSamples(cache, second, 10000).release()
+        os.utime(cache._cachePath(first, 44100, 2), (0, 0))
+        os.utime(cache._cachePath(second, 44100, 2), (1, 1))
+        cache.load(first, 44100, 2).release()
+        self.storeSamples(cache, third, 10000).release()
+        assert cache.size() <= 100000
+        assert cache.load(second, 44100, 2) is None
+        assert cache.load(first, 44100, 2) is not None
+        assert cache.load(third, 44100, 2) is not None
+
+    def test_accepts(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1000)
+        assert cache.accepts(250, 2, np.int16)
+        assert not cache.accepts(251, 2, np.int16)
+
+    def test_purge(self, tmp_path):
+        cache = PcmCache(str(tmp_path / 'cache'), 1 << 20)
+        filename = self.mediaFile(tmp_path)
+        self.storeSamples(cache, filename).release()
+        cache.purge()
+        assert cache.size() == 0
+        assert cache.load(filename, 44100, 2) is None
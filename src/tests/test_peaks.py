@@ -0,0 +1,61 @@
+import numpy as np
+
+from cue.peaks import PeakPyramid
+
+
+def buildPyramid(samples: np.ndarray, blockSize: int = 1024) -> PeakPyramid:
+    pyramid = PeakPyramid(len(samples), 1000)
+    for position in range(0, len(samples), blockSize):
+        pyramid.add(position, samples[position:position + blockSize])
+    return pyramid.build()
+
+
+class TestPeakPyramid:
+    def test_finestLevel(self):
+        samples = np.zeros((200, 2), dtype=np.int16)
+        samples[10, 0] = 100
+        samples[70, 0] = -50
+        samples[150, 1] = 1000
+        level = buildPyramid(samples, 128).levels[0]
+        assert len(level) == 4
+        assert level.maximum.tolist() == [100, 0, 0, 0]
+        assert level.minimum.tolist() == [0, -50, 0, 0]
+
+    def test_lastPartialBucket(self):
+        samples = np.zeros((70, 1), dtype=np.int16)
+        samples[69, 0] = 42
+        level = buildPyramid(samples).levels[0]
+        assert level.maximum.tolist() == [0, 42]
+
+    def test_coarserLevelsKeepPeaks(self):
+        rng = np.random.default_rng(0)
+        samples = rng.integers(-1000, 1000, size=(100000, 1), dtype=np.int16)
+        pyramid = buildPyramid(samples, 16384)
+        assert len(pyramid.levels) > 1
+        assert len(pyramid.levels[-1]) < PeakPyramid.MIN_LENGTH
+        for finer, coarser in zip(pyramid.levels, pyramid.levels[1:]):
+            assert coarser.bucketFrames == finer.bucketFrames * PeakPyramid.FACTOR
+            assert coarser.maximum.max() == finer.maximum.max()
+            assert coarser.minimum.min() == finer.minimum.min()
+
+    def test_levelForWidth(self):
+        samples = np.zeros((100000, 1), dtype=np.int16)
+        pyramid = buildPyramid(samples, 16384)
+        level = pyramid.level(800)
+        assert len(level) >= 800
+        assert len(pyramid.levels[pyramid.levels.index(level) + 1]) < 800
+        assert pyramid.level(10 ** 9) is pyramid.levels[0]
+
+    def test_times(self):
+        level = buildPyramid(np.zeros((256, 1), dtype=np.int16)).levels[0]
+        assert level.times.tolist() == [0.0, 0.064, 0.128, 0.192]
+
+    def test_fit(self):
+        samples = np.zeros((64 * 10, 1), dtype=np.int16)
+        samples[64 * 9, 0] = 5
+        level = buildPyramid(samples).levels[0]
+        fitted = level.fit(4)
+        assert len(fitted) == 4
+        assert fitted.bucketFrames == 64 * 3
+        assert fitted.maximum.tolist() == [0, 0, 0, 5]
+        assert level.fit(10) is level
@@ -1,5 +1,8 @@
 import pytest
-from engine.player import PlayerCommand, InvalidCommand
+from cue.fade import Fade
+from cue.volume import Volume
+from engine.ipc import MessagePipe
+from engine.player import PlayerCommand, PlayerStates, InvalidCommand, InvalidMessage
 
 
 class TestPlayerCommand:
@@ -38,3 +41,53 @@ class TestPlayerCommand:
     def test_toMessageWithNullValue(self):
         cmd = PlayerCommand('setEnd', 0.0)
         assert cmd.toMessage() == {'command': 'setEnd', 'value': 0.0}
+
+    def test_toMessageWithCueId(self):
+        cmd = PlayerCommand('play', cueId=3)
+        assert cmd.toMessage() == {'command': 'play', 'cue': 3}
+
+    def test_fromMessageWithCueId(self):
+        cmd = PlayerCommand.fromMessage({'command': 'volume', 'value': 1.5, 'cue': 7})
+        assert cmd.command == 'volume'
+        assert cmd.value == 1.5
+        assert cmd.cueId == 7
+
+    def test_bytesRoundTrip(self):
+        for value in (None, 3, 4.5, PlayerStates.Armed, {'buffer': '/dev/shm/cue.npy'}):
+            cmd = PlayerCommand.fromBytes(PlayerCommand('setStart', value, 2).toBytes())
+            assert cmd.command == 'setStart'
+            assert cmd.value == value
+            assert cmd.cueId == 2
+
+    def test_bytesWithVolumeAndFade(self):
+        volume = PlayerCommand.fromBytes(PlayerCommand('volume', Volume(-3.0, 1.0, 2.0)).toBytes()).value
+        assert volume.getVolume() == (-3.0, 1.0, 2.0)
+        fade = PlayerCommand.fromBytes(PlayerCommand('fade', Fade(1.5, 2.5)).toBytes()).value
+        assert fade.getFade() == (1.5, 2.5)
+
+    def test_bytesWithoutCueId(self):
+        cmd = PlayerCommand('quit')
+        cmd.sentAt = 12.5
+        cmd = PlayerCommand.fromBytes(cmd.toBytes())
+        assert cmd.cueId is None
+        assert cmd.sentAt == 12.5
+
+    def test_fromWrongBytes(self):
+        with pytest.raises(InvalidMessage):
+            PlayerCommand.fromBytes(b'\xff')
+
+    def test_throughPipe(self):
+        pipe = MessagePipe()
+        assert pipe.receive(0) is None
+        pipe.send(PlayerCommand('play', cueId=1).toBytes())
+        assert PlayerCommand.fromBytes(pipe.receive(1.0)).command == 'play'
+
+    def test_fullPipeDropsMessages(self):
+        pipe = MessagePipe(blockingWrite=False)
+        message = PlayerCommand('elapsedTime', 1000, 1).toBytes()
+        while pipe.send(message):
+            pass
+        received = 0
+        while pipe.receive(0) is not None:
+            received += 1
+        assert received > 0
@@ -0,0 +1,22 @@
+from engine.positions import PositionTable
+
+
+class TestPositionTable:
+    def test_writeThenRead(self):
+        table = PositionTable.create(4)
+        other = PositionTable.attach(table.path)
+        other.write(2, 44100, 12.5, 1)
+        assert table.read(2) == (44100, 12.5, 1)
+        assert table.read(1) == (0, 0.0, 0)
+        other.release()
+        table.release()
+
+    def test_writerStoppedDuringWrite(self):
+        table = PositionTable.create(4)
+        table.write(1, 44100, 12.5, 1)
+        assert table.read(1) == (44100, 12.5, 1)
+        # Sequence left odd, as by a mixer process killed in the middle of a write
+        table._records['sequence'][1] += 1
+        table._records['position'][1] = 88200
+        assert table.read(1) == (44100, 12.5, 1)
+        table.release()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from engine.resampler import Resampler
+
+
+def resample(resampler, samples, position, count):
+    # Input range padded with zeros outside the samples, like decoders do
+    first, last = resampler.inputRange(position, count)
+    padded = np.zeros((last - first, samples.shape[1]), dtype=np.float32)
+    start, end = max(first, 0), min(last, len(samples))
+    padded[start - first:end - first] = samples[start:end]
+    return resampler.resample(padded, first, position, count)
+
+
+def sine(frequency, rate, frames):
+    return np.sin(2 * np.pi * frequency * np.arange(frames) / rate).astype(np.float32)[:, np.newaxis]
+
+
+class TestResampler:
+    def test_frames(self):
+        assert Resampler(48000, 44100).frames(48000) == 44100
+        assert Resampler(22050, 44100).frames(3) == 6
+
+    def test_sineIsPreserved(self):
+        resampler = Resampler(48000, 44100)
+        out = resample(resampler, sine(1000, 48000, 4800), 0, 4410)
+        expected = sine(1000, 44100, 4410)
+        assert np.abs(out - expected)[100:-100].max() < 1e-3
+
+    def test_blocksAreIndependent(self):
+        resampler = Resampler(22050, 44100)
+        samples = np.random.default_rng(0).uniform(-1, 1, (1000, 2)).astype(np.float32)
+        whole = resample(resampler, samples, 0, 2000)
+        blocks = np.concatenate([resample(resampler, samples, 0, 777), resample(resampler, samples, 777, 1223)])
+        assert np.allclose(whole, blocks, atol=1e-6)
+
+    def test_manyPhases(self):
+        # Ratio with more exact phases than the kernel has
+        resampler = Resampler(44101, 44100)
+        out = resample(resampler, np.full((44101, 1), 0.5, dtype=np.float32), 0, 44100)
+        assert np.allclose(out[100:-100], 0.5, atol=1e-4)
+
+    def test_downsamplingRemovesAliases(self):
+        resampler = Resampler(96000, 44100)
+        out = resample(resampler, sine(30000, 96000, 9600), 0, 4410)
+        assert np.sqrt(np.mean(out[100:-100] ** 2)) < 0.01
@@ -0,0 +1,54 @@
+import numpy as np
+
+from engine.ringbuffer import RingBuffer
+
+
+class TestRingBuffer:
+    def test_writeThenRead(self):
+        ring = RingBuffer(8, 2)
+        samples = np.arange(10, dtype=np.int16).reshape(5, 2)
+        assert ring.write(samples) == 5
+        assert ring.available() == 5
+        out = np.zeros((5, 2), dtype=np.int16)
+        assert ring.readInto(out) == 5
+        assert np.array_equal(out, samples)
+        assert ring.free() == 8
+
+    def test_writeWhenFull(self):
+        ring = RingBuffer(4, 2)
+        assert ring.write(np.ones((6, 2), dtype=np.int16)) == 4
+        assert ring.free() == 0
+        assert ring.write(np.ones((1, 2), dtype=np.int16)) == 0
+
+    def test_wrapAround(self):
+        ring = RingBuffer(4, 1)
+        out = np.zeros((3, 1), dtype=np.int16)
+        ring.write(np.array([[1], [2], [3]]))
+        ring.readInto(out)
+        ring.write(np.array([[4], [5], [6]]))
+        assert ring.readInto(out) == 3
+        assert out[:, 0].tolist() == [4, 5, 6]
+        assert ring.written == ring.read == 6
+
+    def test_readMoreThanAvailable(self):
+        ring = RingBuffer(4, 1)
+        ring.write(np.array([[1]]))
+        out = np.zeros((3, 1), dtype=np.int16)
+        assert ring.readInto(out) == 1
+
+    def test_floatSamplesConverted(self):
+        ring = RingBuffer(2, 1)
+        ring.write(np.array([[1.0], [-2.0]], dtype=np.float32))
+        out = np.zeros((2, 1), dtype=np.int16)
+        ring.readInto(out)
+        assert out[:, 0].tolist() == [1, -2]
+
+    def test_addToQueuedFrames(self):
+        ring = RingBuffer(4, 1)
+        out = np.zeros((3, 1), dtype=np.int16)
+        ring.write(np.array([[1], [2], [3]]))
+        ring.readInto(out)
+        ring.write(np.array([[4], [32760], [5]]))
+        assert ring.add(4, np.array([[10], [20], [30]], dtype=np.float32)) == 2
+        ring.readInto(out)
+        assert out[:, 0].tolist() == [4, 32767, 25]
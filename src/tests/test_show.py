@@ -0,0 +1,80 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from cue.audiocue import AudioCue
+from cue.fade import Fade
+from cue.show import InvalidShow, loadShow, saveShow
+from cue.volume import Volume
+
+SAMPLE = Path(__file__).parent / 'sample-1.wav'
+
+
+@pytest.fixture
+def media(tmp_path):
+    QCoreApplication.instance() or QCoreApplication([])
+    path = tmp_path / 'media' / 'sample.wav'
+    path.parent.mkdir()
+    shutil.copy(SAMPLE, path)
+    return str(path)
+
+
+def savedCue(media):
+    cue = AudioCue(media, load=False)
+    cue.cueInfo.duration = 10.0
+    cue.setName('Intro')
+    cue.setLoop(2)
+    cue.setVolume(Volume(-3.0, -1.0, 0.5))
+    cue.setFadeDuration(Fade(1.5, 2.0))
+    cue.setEndsAt(8.0)
+    cue.setStartsAs(0.5)
+    cue.setRouting([[1.0, 0.0], [0.5, 0.5]])
+    cue.setContentHash('0123')
+    return cue
+
+
+class TestShow:
+    def test_roundTrip(self, tmp_path, media):
+        filename = str(tmp_path / 'show.qsound')
+        saveShow(filename, [savedCue(media)])
+        cue, = loadShow(filename)
+        assert cue.getFilename() == media
+        assert cue.getName() == 'Intro'
+        assert cue.cueInfo.duration == 10.0
+        assert (cue.getStartsAt(), cue.getEndsAt()) == (0.5, 8.0)
+        assert cue.getLoop() == 2
+        assert cue.getVolume().getVolume() == (-3.0, -1.0, 0.5)
+        assert cue.getFadeDuration().getFade() == (1.5, 2.0)
+        assert cue.getRouting() == [[1.0, 0.0], [0.5, 0.5]]
+        assert cue.getContentHash() == '0123'
+
+    def test_loadDoesNotDecode(self, tmp_path, media):
+        filename = str(tmp_path / 'show.qsound')
+        saveShow(filename, [savedCue(media) for _ in range(10)])
+        cues = loadShow(filename)
+        assert len(cues) == 10
+        assert not any(cue.isLoaded() or cue.isLoading() for cue in cues)
+
+    def test_pathsAreRelative(self, tmp_path, media):
+        filename = str(tmp_path / 'show.qsound')
+        saveShow(filename, [savedCue(media)])
+        with open(filename) as file:
+            assert json.load(file)['cues'][0]['path'] == str(Path('media') / 'sample.wav')
+        # Show moved with its media
+        moved = tmp_path / 'moved'
+        shutil.copytree(tmp_path / 'media', moved / 'media')
+        shutil.copy(filename, moved)
+        cue, = loadShow(str(moved / 'show.qsound'))
+        assert cue.getFilename() == str(moved / 'media' / 'sample.wav')
+
+    def test_invalid(self, tmp_path, media):
+        filename = tmp_path / 'show.qsound'
+        filename.write_text('not json')
+        with pytest.raises(InvalidShow):
+            loadShow(str(filename))
+        filename.write_text(json.dumps({'version': 1, 'cues': [{'path': 'sample.wav'}]}))
+        with pytest.raises(InvalidShow):
+            loadShow(str(filename))
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from startup import StartupTimer
+
+SOURCES = Path(__file__).parent.parent
+
+
+class TestStartup:
+    def test_timer(self):
+        timer = StartupTimer()
+        timer.install()
+        try:
+            sys.modules.pop('tabnanny', None)
+            import tabnanny  # noqa: F401
+            timer.mark('Import')
+        finally:
+            timer.uninstall()
+        report = timer.report()
+        assert 'Import' in report
+        assert 'tabnanny' in report
+
+    def test_mainWindowIsLight(self):
+        # Heavy modules are imported once the window is shown
+        heavy = ('numpy', 'pydub', 'pyaudio', 'PySide6.QtCharts', 'engine.player')
+        code = f'import sys, ui.mainwindow; print([m for m in {heavy!r} if m in sys.modules])'
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(SOURCES), os.environ.get('PYTHONPATH', '')])}
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=SOURCES, env=env)
+        assert result.stdout.strip() == '[]', result.stderr
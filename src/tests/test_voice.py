@@ -0,0 +1,114 @@
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from engine.ipc import MessagePipe
+from engine.pcmbuffer import PcmBuffer
+from engine.player import MixerProcess, PlayerCommand, PlayerStates, Voice
+
+
+@pytest.fixture
+def ramp():
+    buffer = PcmBuffer.create(10000, 2, np.int16)
+    buffer.samples[:] = np.arange(10000)[:, np.newaxis]
+    yield buffer
+    buffer.release()
+
+
+def voice(source: PcmBuffer | dict, *commands: PlayerCommand) -> Voice:
+    # Chunks of 441 frames
+    if isinstance(source, PcmBuffer):
+        source = {'buffer': source.path}
+    result = Voice(0, source, MessagePipe(blockingWrite=False), 10.0)
+    for command in commands:
+        result.execute(command)
+    return result
+
+
+def renderAll(voice: Voice) -> np.ndarray:
+    chunks = []
+    voice.execute(PlayerCommand('play'))
+    while voice.isPlaying():
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        chunks.append(mix[:voice.render(mix)])
+    return np.concatenate(chunks)[:, 0]
+
+
+class TestVoice:
+    def test_startAndEndAreSampleAccurate(self, ramp):
+        frames = renderAll(voice(
+            ramp,
+            PlayerCommand('setStart', 1000 / MixerProcess.FRAME_RATE),
+            PlayerCommand('setEnd', 2001 / MixerProcess.FRAME_RATE)
+        ))
+        assert np.array_equal(frames, np.arange(1000, 2001))
+
+    def test_loopsAreGapless(self, ramp):
+        frames = renderAll(voice(
+            ramp,
+            PlayerCommand('setStart', 100 / MixerProcess.FRAME_RATE),
+            PlayerCommand('setEnd', 600 / MixerProcess.FRAME_RATE),
+            PlayerCommand('loop', 2)
+        ))
+        assert np.array_equal(frames, np.tile(np.arange(100, 600), 3))
+
+    def test_lastChunkIsShorter(self, ramp):
+        cue = voice(ramp, PlayerCommand('setEnd', 500 / MixerProcess.FRAME_RATE))
+        cue.execute(PlayerCommand('play'))
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        assert cue.render(mix) == 441
+        mix[:] = 0
+        assert cue.render(mix) == 59
+        assert cue.getPlayerState() == PlayerStates.Stopped
+
+    def test_emptyLoopStops(self, ramp):
+        cue = voice(ramp, PlayerCommand('setEnd', 0.0), PlayerCommand('loop', -1))
+        cue.execute(PlayerCommand('play'))
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        assert cue.render(mix) == 0
+        assert not cue.isPlaying()
+
+    def test_monoIsRoutedToBothOutputs(self):
+        buffer = PcmBuffer.create(441, 1, np.int16)
+        buffer.samples[:, 0] = 100
+        cue = voice(buffer)
+        cue.execute(PlayerCommand('play'))
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        cue.render(mix)
+        buffer.release()
+        assert np.all(mix == 100)
+
+    def test_routing(self, ramp):
+        # Left and right swapped, left at half gain on both outputs
+        cue = voice(ramp, PlayerCommand('routing', [[0.5, 0.5], [1.0, 0.0]]))
+        cue.execute(PlayerCommand('play'))
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        cue.render(mix)
+        assert np.array_equal(mix[:, 0], np.arange(441) * 1.5)
+        assert np.array_equal(mix[:, 1], np.arange(441) * 0.5)
+
+    def test_wrongRoutingIsIgnored(self, ramp):
+        cue = voice(ramp, PlayerCommand('routing', [[1.0, 1.0, 1.0]]))
+        cue.execute(PlayerCommand('play'))
+        mix = np.zeros((441, MixerProcess.CHANNELS), dtype=np.float32)
+        cue.render(mix)
+        assert np.array_equal(mix[:, 1], np.arange(441))
+
+    def test_streamedLoop(self):
+        filename = str(Path(__file__).parent / 'sample-1.wav')
+        with wave.open(filename, 'rb') as wav:
+            frames = wav.getnframes()
+            samples = np.frombuffer(wav.readframes(frames), dtype='<i2').reshape(-1, 2)
+        # Length and channels come with the source, the mixer does not probe the file
+        source = {'stream': filename, 'frames': frames, 'channels': 2, 'readAhead': 20000}
+        cue = voice(
+            source,
+            PlayerCommand('setStart', 1000 / MixerProcess.FRAME_RATE),
+            PlayerCommand('setEnd', 50000 / MixerProcess.FRAME_RATE),
+            PlayerCommand('loop', 1)
+        )
+        result = renderAll(cue)
+        cue.release()
+        assert np.array_equal(result, np.tile(samples[1000:50000, 0], 2))
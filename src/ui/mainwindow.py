@@ -1,23 +1,33 @@
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from PySide6.QtCore import QModelIndex, QSize, Qt, QTime, Slot
+from PySide6.QtCore import QFileInfo, QModelIndex, QSize, Qt, QTimer, Slot
 from PySide6.QtGui import QAction, QCloseEvent, QKeySequence
-from PySide6.QtWidgets import (QApplication, QHBoxLayout, QMainWindow,
+from PySide6.QtWidgets import (QApplication, QHBoxLayout, QLabel, QMainWindow,
                                QMessageBox, QVBoxLayout, QWidget)
 
-from cue.audiocue import AudioCue
+from cue.show import InvalidShow, loadShow, saveShow
 from engine.cuelist import CueListModel
 from settings import settings
-from ui.audiocuewidget import AudioCueWidget
 from ui.commands import CommandsWidget
 from ui.cuelistview import CueListView
 from ui.mediafiledialog import MediaFileDialog
+from ui.showfiledialog import ShowFileDialog
+
+if TYPE_CHECKING:
+    from cue.audiocue import AudioCue
+    from ui.audiocuewidget import AudioCueWidget
 
 logger = logging.getLogger(__name__)
 
 
 class MainWidget (QWidget):
+
+    # Following cues are loaded with the selected one, as they are played next
+    LOAD_AHEAD = 2
+    # Seconds given to the media files being loaded to stop on quit
+    QUIT_TIMEOUT = 2.0
+
     def __init__(self, parent: Optional[QWidget] = None, f: Qt.WindowType = Qt.WindowType.Widget) -> None:
         super().__init__(parent, f)
         vBox = QVBoxLayout()
@@ -25,41 +35,46 @@ class MainWidget (QWidget):
         self._cueListModel = CueListModel()
         self._cueListView = CueListView(self._cueListModel)
         self._cueListView.clicked.connect(self.selectedCue)
-        self.audioCueWidget = AudioCueWidget()
-        self.audioCueWidget.setEnabled(False)
-        self.audioCueWidget.volume.fadeChanged.connect(self._cueListModel.updateLayout)
-        self.audioCueWidget.general.nameChanged.connect(self._cueListModel.updateLayout)
-        self.audioCueWidget.general.loopChanged.connect(self._cueListModel.updateLayout)
         self.commands = CommandsWidget()
         hBox.addWidget(self._cueListView, 2)
         hBox.addWidget(self.commands, 1)
         w = QWidget()
         w.setLayout(hBox)
         vBox.addWidget(w, 1)
-        vBox.addWidget(self.audioCueWidget, 1)
         self.setLayout(vBox)
+        # Cue editor pulls in the waveform chart, the designer forms and the
+        # audio engine, it is built once the window is shown
+        self._audioCueWidget: Optional['AudioCueWidget'] = None
+        QTimer.singleShot(0, self.createAudioCueWidget)
+
+    @property
+    def audioCueWidget(self) -> 'AudioCueWidget':
+        if self._audioCueWidget is None:
+            self.createAudioCueWidget()
+        return self._audioCueWidget
+
+    @Slot()
+    def createAudioCueWidget(self) -> None:
+        if self._audioCueWidget is not None:
+            return
+        from ui.audiocuewidget import AudioCueWidget
+        self._audioCueWidget = AudioCueWidget()
+        self._audioCueWidget.setEnabled(False)
+        self._audioCueWidget.volume.fadeChanged.connect(self._cueListModel.updateLayout)
+        self._audioCueWidget.general.nameChanged.connect(self._cueListModel.updateLayout)
+        self._audioCueWidget.general.loopChanged.connect(self._cueListModel.updateLayout)
+        self.layout().addWidget(self._audioCueWidget, 1)
 
     @Slot(QModelIndex)
     def selectedCue(self, index: QModelIndex):
         self.audioCueWidget.setEnabled(True)
-        lastCue = None
-        if self._cueListModel.currentIndex.isValid():
-            lastCue = self._cueListModel.getCue(self._cueListModel.currentIndex)
-            self.audioCueWidget.volume.volumeChanged.disconnect(lastCue.setVolume)
-            self.audioCueWidget.volume.fadeChanged.disconnect(lastCue.setFadeDuration)
-
-            self.audioCueWidget.general.nameChanged.disconnect(lastCue.setName)
-            self.audioCueWidget.general.loopChanged.disconnect(lastCue.setLoop)
-            self.audioCueWidget.general.mediaFileChanged.disconnect(lastCue.changeMediaFile)
-
-            self.audioCueWidget.sound.chartView.disconnect(lastCue)
-            self.commands.playBtn.disconnect(lastCue)
-            self.commands.pauseBtn.disconnect(lastCue)
-            self.commands.stopBtn.disconnect(lastCue)
-            lastCue.changedCue.disconnect(self.audioCueWidget.sound.setPlayCursor)
+        self._unselectCue()
 
         self._cueListModel.currentIndex = index
         cue = self._cueListModel.getCue(index)
+        # Media files of a show are decoded only when needed
+        for nextCue in self._cueListModel.getAllCue()[index.row():index.row() + 1 + self.LOAD_AHEAD]:
+            nextCue.load()
 
         self.audioCueWidget.general.setOrder(index.row())
         self.audioCueWidget.general.setName(cue.getName())
@@ -73,7 +88,9 @@ class MainWidget (QWidget):
         self.audioCueWidget.volume.setFade(cue.getFadeDuration())
         self.audioCueWidget.volume.fadeChanged.connect(cue.setFadeDuration)
         
-        self.audioCueWidget.sound.setSeries(cue.getAudioPoints(), cue.getStartsAt(), cue.getEndsAt())
+        # Waveform is shown once the media file is loaded
+        self.showWaveform()
+        cue.loaded.connect(self.showWaveform)
         self.audioCueWidget.sound.chartView.changedStart.connect(cue.setStartsAs)
         self.audioCueWidget.sound.chartView.changedEnd.connect(cue.setEndsAt)
         cue.audioSignalChanged.connect(self.audioCueWidget.sound.setSeries)
@@ -82,44 +99,123 @@ class MainWidget (QWidget):
         self.commands.pauseBtn.pressed.connect(cue.pause)
         self.commands.stopBtn.pressed.connect(cue.stop)
 
-    def addCue(self, cue: AudioCue) -> None:
+    def _unselectCue(self) -> None:
+        if not self._cueListModel.currentIndex.isValid():
+            return
+        lastCue = self._cueListModel.getCue(self._cueListModel.currentIndex)
+        self.audioCueWidget.volume.volumeChanged.disconnect(lastCue.setVolume)
+        self.audioCueWidget.volume.fadeChanged.disconnect(lastCue.setFadeDuration)
+
+        self.audioCueWidget.general.nameChanged.disconnect(lastCue.setName)
+        self.audioCueWidget.general.loopChanged.disconnect(lastCue.setLoop)
+        self.audioCueWidget.general.mediaFileChanged.disconnect(lastCue.changeMediaFile)
+
+        self.audioCueWidget.sound.chartView.disconnect(lastCue)
+        self.commands.playBtn.disconnect(lastCue)
+        self.commands.pauseBtn.disconnect(lastCue)
+        self.commands.stopBtn.disconnect(lastCue)
+        lastCue.changedCue.disconnect(self.audioCueWidget.sound.setPlayCursor)
+        lastCue.loaded.disconnect(self.showWaveform)
+
+    @Slot()
+    def showWaveform(self):
+        cue = self._cueListModel.getCue(self._cueListModel.currentIndex)
+        if cue is None or not cue.isLoaded():
+            self.audioCueWidget.sound.clear()
+            return
+        self.audioCueWidget.sound.setSeries(
+            cue.getAudioPoints(self.audioCueWidget.sound.waveformWidth()),
+            cue.getStartsAt(),
+            cue.getEndsAt()
+        )
+
+    def addCue(self, cue: 'AudioCue') -> None:
         self._cueListModel.addCue(cue)
         # lastIndex = self._cueListModel.index(self._cueListModel.rowCount(0) - 1, 0)
         # self._cueListView.setCurrentIndex(lastIndex)
         # self.selectedCue(lastIndex)
 
+    def addCues(self, cues: list['AudioCue']) -> None:
+        self._cueListModel.addCues(cues)
+
+    def getAllCue(self) -> list['AudioCue']:
+        return self._cueListModel.getAllCue()
+
+    def clear(self) -> None:
+        # Every cue is released, the show is empty
+        self._unselectCue()
+        self._cueListModel.clear()
+        self.audioCueWidget.sound.clear()
+        self.audioCueWidget.setEnabled(False)
+
     def stop(self):
         for cue in self._cueListModel.getAllCue():
             cue.stop()
 
+    def quit(self) -> None:
+        # Sound stops at once with the mixer process, then every cue is
+        # released and loadings are cancelled together, waited for once
+        from engine.player import Engine
+        engine = Engine.current()
+        if engine is not None:
+            engine.quit()
+        cues = self._cueListModel.getAllCue()
+        for cue in cues:
+            cue.quit()
+        if cues:
+            from cue.audioloader import AudioLoader
+            if not AudioLoader.waitForDone(self.QUIT_TIMEOUT):
+                logger.error('Media files still loading on quit')
+
 
 class MainWindow (QMainWindow):
 
+    # Audio health shown in the status bar is refreshed at this interval, in ms
+    HEALTH_INTERVAL = 1000
+
     def __init__(
         self,
         parent: Optional[QWidget] = None,
         flags: Qt.WindowType = Qt.WindowType.Dialog
     ) -> None:
         super().__init__(parent, flags)
+        self._showFilename: Optional[str] = None
         self.createMenuBar()
         self.setWindowTitle('QSound')
 
         self.mainWidget = MainWidget()
         self.setCentralWidget(self.mainWidget)
+
+        self._healthLabel = QLabel()
+        self.statusBar().addPermanentWidget(self._healthLabel)
+        self._healthTimer = QTimer(self)
+        self._healthTimer.setInterval(self.HEALTH_INTERVAL)
+        self._healthTimer.timeout.connect(self.showHealth)
+        self._healthTimer.start()
+        # Mixer process and audio device are started once the window is
+        # shown, so the first cue played does not wait for them
+        QTimer.singleShot(0, self.startEngine)
         
     def createMenuBar(self):
         newAction = QAction(self.tr('New...'), self)
         newAction.setShortcuts(QKeySequence.StandardKey.New)
+        newAction.triggered.connect(self.newShow)
+        openAction = QAction(self.tr('Open...'), self)
+        openAction.setShortcut(QKeySequence.StandardKey.Open)
+        openAction.triggered.connect(self.openShow)
         quitAction = QAction(self.tr('Quit'), self)
         quitAction.setShortcut(QKeySequence.StandardKey.Quit)
         quitAction.triggered.connect(self.quit)
         saveAsAction = QAction(self.tr('Save as...'), self)
         saveAsAction.setShortcut(QKeySequence.StandardKey.SaveAs)
+        saveAsAction.triggered.connect(self.saveShowAs)
         saveAction = QAction(self.tr('Save'), self)
         saveAction.setShortcut(QKeySequence.StandardKey.Save)
+        saveAction.triggered.connect(self.saveShow)
 
         fileMenu = self.menuBar().addMenu(self.tr('File'))
         fileMenu.addAction(newAction)
+        fileMenu.addAction(openAction)
         fileMenu.addAction(saveAction)
         fileMenu.addAction(saveAsAction)
         fileMenu.addSeparator()
@@ -130,16 +226,99 @@ class MainWindow (QMainWindow):
             QKeySequence(Qt.Modifier.CTRL | Qt.Key.Key_A)
         )
         mediaCueAction.triggered.connect(self.mediaFileSelector)
+        purgeCacheAction = QAction(self.tr('Purge decoded audio cache'), self)
+        purgeCacheAction.triggered.connect(self.purgeCache)
         cueMenu = self.menuBar().addMenu(self.tr('Cues'))
         cueMenu.addAction(mediaCueAction)
+        cueMenu.addSeparator()
+        cueMenu.addAction(purgeCacheAction)
 
     @Slot()
     def mediaFileSelector(self):
+        from cue.audiocue import AudioCue
         filesName = MediaFileDialog(self).getFilenames()
         if filesName is not None:
             for file in filesName:
                 self.mainWidget.addCue(AudioCue(file))
             
+    @Slot()
+    def newShow(self):
+        if self.mainWidget.getAllCue() and not self.mayBeDiscarded():
+            return
+        self.mainWidget.clear()
+        self.setShowFilename(None)
+
+    @Slot()
+    def openShow(self):
+        if self.mainWidget.getAllCue() and not self.mayBeDiscarded():
+            return
+        filename = ShowFileDialog(self).getOpenFilename()
+        if filename is None:
+            return
+        try:
+            cues = loadShow(filename)
+        except InvalidShow as e:
+            QMessageBox.critical(self, self.tr('Open a show'), str(e))
+            return
+        self.mainWidget.clear()
+        self.mainWidget.addCues(cues)
+        self.setShowFilename(filename)
+        self.statusBar().showMessage(self.tr('{} cues loaded').format(len(cues)))
+
+    @Slot()
+    def saveShow(self):
+        if self._showFilename is None:
+            self.saveShowAs()
+            return
+        try:
+            saveShow(self._showFilename, self.mainWidget.getAllCue())
+        except OSError as e:
+            QMessageBox.critical(self, self.tr('Save the show'), str(e))
+            return
+        self.statusBar().showMessage(self.tr('Show saved'))
+
+    @Slot()
+    def saveShowAs(self):
+        filename = ShowFileDialog(self).getSaveFilename()
+        if filename is not None:
+            self.setShowFilename(filename)
+            self.saveShow()
+
+    def setShowFilename(self, filename: Optional[str]) -> None:
+        self._showFilename = filename
+        if filename is None:
+            self.setWindowTitle('QSound')
+        else:
+            self.setWindowTitle(f'QSound - {QFileInfo(filename).fileName()}')
+
+    @Slot()
+    def purgeCache(self):
+        from engine.pcmcache import PcmCache
+        PcmCache.instance().purge()
+        self.statusBar().showMessage(self.tr('Decoded audio cache purged'))
+
+    @Slot()
+    def startEngine(self):
+        from engine.player import Engine
+        Engine.instance()
+
+    @Slot()
+    def showHealth(self):
+        from engine.health import HealthStats
+        from engine.player import Engine
+        engine = Engine.current()
+        if engine is None or not engine.isRunning():
+            return
+        health = engine.health()
+        render = health.percentile(HealthStats.RENDER, 0.99) / 1000.0
+        ipc = health.percentile(HealthStats.IPC, 0.99) / 1000.0
+        underruns = health.counter(HealthStats.UNDERRUNS) + health.counter(HealthStats.DEVICE_UNDERRUNS)
+        self._healthLabel.setText(
+            self.tr('Render {:.1f} ms (max {:.1f})  IPC {:.1f} ms  Underruns {}').format(
+                render, health.maximum(HealthStats.RENDER) / 1000.0, ipc, underruns
+            )
+        )
+
     def writeSettings(self):
         settings.setValue('size', self.size())
         settings.setValue('position', self.pos())
@@ -164,16 +343,23 @@ class MainWindow (QMainWindow):
         )
         return msg == QMessageBox.StandardButton.Ok
 
+    def mayBeDiscarded(self):
+        msg = QMessageBox.warning(
+            self,
+            self.tr('Confirmation ?'),
+            self.tr('Do you really want to close the current show ?'),
+            QMessageBox.StandardButton.Ok | QMessageBox.StandardButton.Cancel,
+            QMessageBox.StandardButton.Cancel
+        )
+        return msg == QMessageBox.StandardButton.Ok
+
     @Slot()
     def quit(self):
         QApplication.quit()
 
     def beforeQuit(self) -> bool:
         if self.mayBeSaved():
-            self.mainWidget.stop()
-            someMsAfter = QTime.currentTime().addMSecs(500)
-            while QTime.currentTime() < someMsAfter:
-                pass
+            self.mainWidget.quit()
             self.writeSettings()
             return True
         return False
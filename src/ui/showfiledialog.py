@@ -0,0 +1,39 @@
+from typing import Optional
+
+from PySide6.QtCore import QDir, QFileInfo, QObject
+from PySide6.QtWidgets import QFileDialog, QWidget
+
+from cue.show import SUFFIX
+from settings import settings
+
+
+class ShowFileDialog (QObject):
+
+    SETTING_KEY = 'Show/directory'
+
+    def __init__(self, parent: QWidget) -> None:
+        super().__init__(parent)
+        self._parent = parent
+        self._filter = f'{self.tr("Show")} (*{SUFFIX})'
+
+    def getOpenFilename(self) -> Optional[str]:
+        filename, _ = QFileDialog.getOpenFileName(self._parent, self.tr('Open a show'), self._directory(), self._filter)
+        return self._selected(filename)
+
+    def getSaveFilename(self) -> Optional[str]:
+        filename, _ = QFileDialog.getSaveFileName(self._parent, self.tr('Save the show'), self._directory(), self._filter)
+        if filename and not filename.endswith(SUFFIX):
+            filename += SUFFIX
+        return self._selected(filename)
+
+    def _directory(self) -> str:
+        directory = settings.value(self.SETTING_KEY)
+        if directory is None or not QDir(directory).exists():
+            directory = QDir().homePath()
+        return directory
+
+    def _selected(self, filename: str) -> Optional[str]:
+        if not filename:
+            return None
+        settings.setValue(self.SETTING_KEY, QFileInfo(filename).absolutePath())
+        return filename
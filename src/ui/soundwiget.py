@@ -3,7 +3,9 @@ from PySide6.QtCore import Qt, Signal, Slot, QPointF, QPoint, QRect, QSize
 from PySide6.QtCharts import QChartView, QChart, QLineSeries, QValueAxis
 from PySide6.QtGui import QPainter, QPen, QColor, QMouseEvent
 from typing import Optional
+import numpy as np
 from cue.audiocue import CueInfo
+from cue.peaks import PeakLevel
 
 
 class ChartView (QChartView):
@@ -146,23 +148,32 @@ class Soundwidget(QWidget):
         hBox.addWidget(self.chartView)
         self.setLayout(hBox)
 
-    def setUp(self, serie: QLineSeries, startPos: float, endPos: float):
+    def setUp(self, serie: QLineSeries, startPos: float, endPos: float, duration: float):
         chart = QChart()
         chart.legend().hide()
         chart.addSeries(serie)
         axisX = QValueAxis()
-        lastPoint = serie.points()[-1]
-        axisX.setRange(0.0, lastPoint.x())
+        axisX.setRange(0.0, duration)
         axisX.setLabelFormat('%.2fs')
         chart.setAxisX(axisX, serie)
         self.chartView.setChart(chart, startPos, endPos)
 
-    @Slot(list)
-    def setSeries(self, points: list, startPos: float, endPos: float):
+    def clear(self) -> None:
+        self.setUp(QLineSeries(), 0.0, 0.0, 0.0)
+
+    def waveformWidth(self) -> int:
+        return self.chartView.width()
+
+    @Slot(PeakLevel, float, float)
+    def setSeries(self, peaks: PeakLevel, startPos: float, endPos: float):
         serie = QLineSeries()
-        for point in points:
-            serie.append(point[0], point[1])
-        self.setUp(serie, startPos, endPos)
+        # Each bucket is drawn as a vertical line from its minimum to its maximum,
+        # at most one per pixel, and all points are given at once to the serie
+        peaks = peaks.fit(self.waveformWidth())
+        x = np.repeat(peaks.times, 2)
+        y = np.column_stack((peaks.maximum, peaks.minimum)).ravel().astype(np.float64)
+        serie.replaceNp(x, y)
+        self.setUp(serie, startPos, endPos, peaks.duration)
 
     @Slot(CueInfo)
     def setPlayCursor(self, cueInfo: CueInfo) -> None: